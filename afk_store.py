@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+class AfkStore:
+    """AFK entries kept in memory and written behind to SQLite.
+
+    `_data` is the source of truth for lookups: {guild_id: {user_id: (reason, since)}}.
+    Changes are recorded in `_dirty` and written in one transaction by `flush()`.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self._data = {}
+        self._dirty = {}  # (guild_id, user_id) -> (reason, since) or None when removed
+        self._writing = None  # the flush write running on a worker thread, if any
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS afk ("
+            "guild_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "reason TEXT NOT NULL, "
+            "since REAL NOT NULL, "
+            "PRIMARY KEY (guild_id, user_id)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute("SELECT guild_id, user_id, reason, since FROM afk")
+        for guild_id, user_id, reason, since in rows:
+            self._data.setdefault(guild_id, {})[user_id] = (reason, since)
+
+    # ---- lookups / mutations (event loop only) ----
+    def set(self, guild_id, user_id, reason, since=None):
+        entry = (reason, since if since is not None else time.time())
+        self._data.setdefault(guild_id, {})[user_id] = entry
+        self._dirty[(guild_id, user_id)] = entry
+
+    def guild_users(self, guild_id):
+        """Live {user_id: (reason, since)} mapping for a guild, or None if nobody is AFK."""
+        return self._data.get(guild_id)
+
+    def get(self, guild_id, user_id):
+        users = self._data.get(guild_id)
+        if not users:
+            return None
+        return users.get(user_id)
+
+    def remove(self, guild_id, user_id):
+        users = self._data.get(guild_id)
+        if not users or user_id not in users:
+            return None
+        entry = users.pop(user_id)
+        if not users:
+            del self._data[guild_id]
+        self._dirty[(guild_id, user_id)] = None
+        return entry
+
+    def expire(self, now=None):
+        if not self.ttl:
+            return 0
+        cutoff = (now or time.time()) - self.ttl
+        stale = [
+            (guild_id, user_id)
+            for guild_id, users in self._data.items()
+            for user_id, (_, since) in users.items()
+            if since < cutoff
+        ]
+        for guild_id, user_id in stale:
+            self.remove(guild_id, user_id)
+        return len(stale)
+
+    # ---- persistence ----
+    async def flush(self):
+        if not self._dirty:
+            return 0
+        # Swap on the loop thread so handlers never touch the dict being written.
+        pending, self._dirty = self._dirty, {}
+        # Shielded: cancelling the flush loop mustn't abandon a swapped-out batch; aclose() waits for it
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self._write, pending))
+        await asyncio.shield(self._writing)
+        return len(pending)
+
+    def flush_sync(self):
+        pending, self._dirty = self._dirty, {}
+        if pending:
+            self._write(pending)
+        return len(pending)
+
+    def _write(self, pending):
+        upserts = [(g, u, e[0], e[1]) for (g, u), e in pending.items() if e is not None]
+        deletes = [(g, u) for (g, u), e in pending.items() if e is None]
+        with self._lock, self._conn:
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO afk (guild_id, user_id, reason, since) VALUES (?, ?, ?, ?)",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany(
+                    "DELETE FROM afk WHERE guild_id = ? AND user_id = ?", deletes
+                )
+
+    def close(self):
+        self.flush_sync()
+        with self._lock:
+            self._conn.close()
+
+    async def aclose(self):
+        """Wait out a flush in progress, then write the rest and close."""
+        if self._writing is not None:
+            await asyncio.wait({self._writing})
+        self.close()
+
+    # ---- reporting ----
+    def __len__(self):
+        return sum(len(users) for users in self._data.values())
+
+    def memory_bytes(self):
+        total = sys.getsizeof(self._data) + sys.getsizeof(self._dirty)
+        for users in self._data.values():
+            total += sys.getsizeof(users)
+            for user_id, entry in users.items():
+                total += sys.getsizeof(user_id) + sys.getsizeof(entry)
+                total += sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+        return total
+
+    def disk_bytes(self):
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+    def stats(self):
+        return {
+            "entries": len(self),
+            "guilds": len(self._data),
+            "pending_writes": len(self._dirty),
+            "memory_bytes": self.memory_bytes(),
+            "disk_bytes": self.disk_bytes(),
+        }
@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict, deque
+
+
+class _UserWindow:
+    __slots__ = ("times", "recent", "counts", "last_seen")
+
+    def __init__(self, max_messages):
+        self.times = deque(maxlen=max_messages)  # timestamps of the last max_messages messages
+        self.recent = deque()  # (timestamp, content hash) inside the duplicate window
+        self.counts = {}  # content hash -> occurrences in `recent`
+        self.last_seen = 0.0
+
+
+class SpamDetector:
+    """Per-user message rate and duplicate-content checks, O(1) per message.
+
+    Rate: a ring of the last `max_messages` timestamps; if the oldest is still
+    inside `window` seconds the user is flooding. Duplicates: content hashes
+    from the last `duplicate_window` seconds (at most `duplicate_history`
+    kept) with a running count per hash. Users idle for `idle_seconds` are
+    evicted, and at most `max_users` are tracked at once. After a violation
+    the user's messages are ignored for `punish_cooldown` seconds, so one
+    burst is punished once rather than once per window.
+    """
+
+    def __init__(self, max_messages=6, window=5.0, max_duplicates=3, duplicate_window=30.0,
+                 duplicate_history=20, idle_seconds=300.0, max_users=50_000, punish_cooldown=60.0,
+                 clock=time.monotonic):
+        self.max_messages = max_messages
+        self.window = window
+        self.max_duplicates = max_duplicates
+        self.duplicate_window = duplicate_window
+        self.duplicate_history = duplicate_history
+        self.idle_seconds = idle_seconds
+        self.max_users = max_users
+        self.punish_cooldown = punish_cooldown
+        self.clock = clock
+        self._users = OrderedDict()  # key -> _UserWindow, least recently active first
+        self._punished = {}  # key -> clock time until which violations are suppressed
+        self.violations = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    @staticmethod
+    def _normalize(content):
+        return " ".join(content.lower().split())
+
+    def check(self, key, content):
+        """Record a message; returns a violation reason, or None if it's fine."""
+        now = self.clock()
+        until = self._punished.get(key)
+        if until is not None:
+            if now < until:
+                return None
+            del self._punished[key]
+        state = self._users.get(key)
+        if state is None:
+            state = self._users[key] = _UserWindow(self.max_messages)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+        state.last_seen = now
+
+        state.times.append(now)
+        if len(state.times) == self.max_messages and now - state.times[0] <= self.window:
+            return self._violation(key, f"sent {self.max_messages} messages in {now - state.times[0]:.1f}s")
+
+        text = self._normalize(content) if content else ""
+        if not text:
+            return None
+        digest = hash(text)
+        recent, counts = state.recent, state.counts
+        while recent and (now - recent[0][0] > self.duplicate_window or len(recent) >= self.duplicate_history):
+            _, old = recent.popleft()
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+        recent.append((now, digest))
+        counts[digest] = counts.get(digest, 0) + 1
+        if counts[digest] >= self.max_duplicates:
+            return self._violation(key, f"repeated the same message {counts[digest]} times")
+        return None
+
+    def _violation(self, key, reason):
+        # Start clean once the cooldown ends; until then the user isn't tracked at all
+        self._users.pop(key, None)
+        self._punished[key] = self.clock() + self.punish_cooldown
+        self.violations += 1
+        return reason
+
+    def forget(self, key):
+        self._users.pop(key, None)
+        self._punished.pop(key, None)
+
+    def evict_idle(self):
+        """Drop users idle longer than idle_seconds and lapsed cooldowns; returns how many users were dropped."""
+        now = self.clock()
+        for key in [key for key, until in self._punished.items() if until <= now]:
+            del self._punished[key]
+        cutoff = now - self.idle_seconds
+        dropped = 0
+        while self._users:
+            key, state = next(iter(self._users.items()))
+            if state.last_seen > cutoff:
+                break
+            del self._users[key]
+            dropped += 1
+        return dropped
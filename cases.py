@@ -0,0 +1,193 @@
+import queue
+import sqlite3
+import threading
+import time
+
+CASE_COLUMNS = (
+    "id", "guild_id", "action", "target_id", "target_name", "moderator_id", "reason", "duration", "created_at"
+)
+
+
+class CaseStore:
+    """Moderation cases in SQLite, written by one background thread.
+
+    `record()` allocates the case ID in memory and returns at once; the
+    writer thread drains its queue and commits in batches, so moderation
+    commands never touch the disk. Reads use their own connection (WAL lets
+    them run alongside the writer) and also see cases still in the queue.
+    Listing is keyset-paginated on the ID, which increases with time, so a
+    page costs one index range scan however deep it is.
+    """
+
+    def __init__(self, path, batch_size=500, retry_delay=0.5, max_retry_delay=30.0, close_attempts=5):
+        self.path = path
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.close_attempts = close_attempts  # write attempts per batch once close() has been called
+        self._closing = False
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cases ("
+            "id INTEGER PRIMARY KEY, "
+            "guild_id INTEGER NOT NULL, "
+            "action TEXT NOT NULL, "
+            "target_id INTEGER NOT NULL, "
+            "target_name TEXT, "
+            "moderator_id INTEGER NOT NULL, "
+            "reason TEXT, "
+            "duration TEXT, "
+            "created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cases_target ON cases (guild_id, target_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cases_moderator ON cases (guild_id, moderator_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cases_time ON cases (guild_id, created_at)")
+        conn.commit()
+        self._next_id = (conn.execute("SELECT MAX(id) FROM cases").fetchone()[0] or 0) + 1
+        conn.close()
+
+        self._id_lock = threading.Lock()
+        self._pending = {}  # id -> row dict, until the writer commits it
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="case-writer", daemon=True)
+        self._writer.start()
+
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+    # ---- writing ----
+    def record(self, guild_id, action, target_id, target_name, moderator_id, reason=None, duration=None):
+        """Queue a case and return its ID without waiting for the write."""
+        with self._id_lock:
+            case_id = self._next_id
+            self._next_id += 1
+            row = {
+                "id": case_id,
+                "guild_id": guild_id,
+                "action": action,
+                "target_id": target_id,
+                "target_name": target_name,
+                "moderator_id": moderator_id,
+                "reason": reason,
+                "duration": duration,
+                "created_at": time.time(),
+            }
+            self._pending[case_id] = row
+        self._queue.put(row)
+        return case_id
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        while True:
+            row = self._queue.get()
+            if row is None:
+                break
+            batch = [row]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            self._write_batch(conn, batch)
+            with self._id_lock:
+                for row in batch:
+                    self._pending.pop(row["id"], None)
+            if stop:
+                break
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        """Insert a batch, retrying with backoff; only gives up once closing and out of attempts."""
+        delay = self.retry_delay
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO cases ({', '.join(CASE_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(CASE_COLUMNS))})",
+                        [tuple(row[c] for c in CASE_COLUMNS) for row in batch],
+                    )
+                return True
+            except sqlite3.Error as e:
+                if self._closing and attempts >= self.close_attempts:
+                    print(f"Case write failed at shutdown, {len(batch)} cases lost: {e}")
+                    return False
+                print(f"Case write failed ({len(batch)} cases), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def close(self):
+        """Write everything queued, then close both connections."""
+        self._closing = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    # ---- reading ----
+    def get(self, guild_id, case_id):
+        with self._id_lock:
+            row = self._pending.get(case_id)
+        if row is not None:
+            return dict(row) if row["guild_id"] == guild_id else None
+        with self._read_lock:
+            found = self._reader.execute(
+                f"SELECT {', '.join(CASE_COLUMNS)} FROM cases WHERE id = ? AND guild_id = ?", (case_id, guild_id)
+            ).fetchone()
+        return dict(zip(CASE_COLUMNS, found)) if found else None
+
+    def page(self, guild_id, target_id=None, moderator_id=None, before_id=None, limit=10):
+        """Newest-first cases with id < before_id; returns (rows, next_before_id or None)."""
+        where, args = ["guild_id = ?"], [guild_id]
+        if target_id is not None:
+            where.append("target_id = ?")
+            args.append(target_id)
+        if moderator_id is not None:
+            where.append("moderator_id = ?")
+            args.append(moderator_id)
+        if before_id is not None:
+            where.append("id < ?")
+            args.append(before_id)
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT {', '.join(CASE_COLUMNS)} FROM cases WHERE {' AND '.join(where)} "
+                f"ORDER BY id DESC LIMIT ?",
+                args + [limit + 1],
+            ).fetchall()
+        rows = {row[0]: dict(zip(CASE_COLUMNS, row)) for row in rows}
+
+        # Queued cases are the newest ones; fold in any that match
+        with self._id_lock:
+            pending = [dict(row) for row in self._pending.values()]
+        for row in pending:
+            if (
+                row["guild_id"] == guild_id
+                and (target_id is None or row["target_id"] == target_id)
+                and (moderator_id is None or row["moderator_id"] == moderator_id)
+                and (before_id is None or row["id"] < before_id)
+            ):
+                rows[row["id"]] = row
+
+        ordered = sorted(rows.values(), key=lambda row: row["id"], reverse=True)
+        if len(ordered) > limit:
+            return ordered[:limit], ordered[limit - 1]["id"]
+        return ordered, None
+
+    def count(self, guild_id):
+        # The writer commits before it drops rows from _pending, so a row can be in
+        # both. Batches commit in ID order: anything up to the stored MAX(id) is on disk.
+        with self._id_lock:
+            pending = [case_id for case_id, row in self._pending.items() if row["guild_id"] == guild_id]
+        with self._read_lock:
+            stored, max_id = self._reader.execute(
+                "SELECT (SELECT COUNT(*) FROM cases WHERE guild_id = ?), (SELECT MAX(id) FROM cases)", (guild_id,)
+            ).fetchone()
+        return stored + sum(1 for case_id in pending if case_id > (max_id or 0))
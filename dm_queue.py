@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import random
+import sqlite3
+import threading
+import time
+
+# Lower sorts first. Moderation notices must beat the action they announce (a
+# banned user can't be DMed), so they go ahead of even a bulk run of receipts.
+PRIORITY_MODERATION = 0
+PRIORITY_RECEIPT = 1
+PRIORITY_WELCOME = 5
+
+
+class DMJob:
+    __slots__ = ("id", "kind", "user_id", "send", "priority", "ref", "attempts", "created_at", "done")
+
+    def __init__(self, job_id, kind, user_id, send, priority, ref, done):
+        self.id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.send = send  # zero-arg coroutine factory; called again on every attempt
+        self.priority = priority
+        self.ref = ref
+        self.attempts = 0
+        self.created_at = time.time()
+        self.done = done  # Future resolved with True (delivered) / False (failed)
+
+
+class DMQueue:
+    """Outbound DM queue drained by a bounded worker pool.
+
+    Sends are paced by a global token bucket plus a minimum gap per recipient
+    (each DM channel is its own rate-limit route). `is_transient(exc)` decides
+    whether a failure is retried with exponential backoff; everything else is
+    final. Every final outcome is written to SQLite so staff can look up
+    deliveries that never arrived.
+    """
+
+    def __init__(self, path, is_transient, workers=3, rate_per_second=5.0,
+                 per_user_interval=1.0, max_attempts=4, base_backoff=2.0):
+        self.is_transient = is_transient
+        self.workers = workers
+        self.rate = rate_per_second
+        self.per_user_interval = per_user_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count(1)
+        self._tokens = rate_per_second
+        self._refilled_at = time.monotonic()
+        self._last_sent = {}  # user_id -> monotonic time of last attempt
+        self._delayed = {}  # job -> call_later handle, for jobs waiting out a backoff or per-user gap
+        self.counts = {"queued": 0, "delivered": 0, "failed": 0, "retried": 0}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dm_outcomes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "ref TEXT, "
+            "status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, "
+            "error TEXT, "
+            "queued_at REAL NOT NULL, "
+            "finished_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS dm_outcomes_kind_status ON dm_outcomes (kind, status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS dm_outcomes_user ON dm_outcomes (user_id, id)")
+        self._conn.commit()
+
+    # ---- lifecycle ----
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout=5.0):
+        """Give queued DMs a moment to go out, then record the rest as dropped."""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            for task in self._tasks:
+                task.cancel()
+            while not self._queue.empty():
+                *_, job = self._queue.get_nowait()
+                self._drop(job)
+            for job, handle in self._delayed.items():
+                handle.cancel()
+                self._drop(job)
+            self._delayed.clear()
+        with self._lock:
+            self._conn.close()
+
+    # ---- producer side ----
+    def submit(self, kind, user_id, send, priority=PRIORITY_WELCOME, ref=None):
+        """Queue a DM; returns a future that resolves to True once delivered, False if it failed."""
+        done = asyncio.get_running_loop().create_future()
+        job = DMJob(next(self._seq), kind, user_id, send, priority, ref, done)
+        self.counts["queued"] += 1
+        self._put(job)
+        return done
+
+    def _put(self, job):
+        self._queue.put_nowait((job.priority, job.id, job))
+
+    def _put_later(self, job, delay):
+        def put():
+            self._delayed.pop(job, None)
+            self._put(job)
+
+        self._delayed[job] = asyncio.get_running_loop().call_later(delay, put)
+
+    # ---- worker side ----
+    async def _acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _worker(self):
+        while True:
+            *_, job = await self._queue.get()
+            try:
+                await self._attempt(job)
+            except Exception as e:
+                print(f"DM worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _attempt(self, job):
+        wait = self._last_sent.get(job.user_id, 0) + self.per_user_interval - time.monotonic()
+        if wait > 0:
+            self._put_later(job, wait)
+            return
+        await self._acquire()
+        self._last_sent[job.user_id] = time.monotonic()
+        job.attempts += 1
+        try:
+            await job.send()
+        except Exception as e:
+            if self.is_transient(e) and job.attempts < self.max_attempts:
+                self.counts["retried"] += 1
+                delay = self.base_backoff * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+                self._put_later(job, delay)
+                return
+            self.counts["failed"] += 1
+            self._finish(job, "failed", f"{type(e).__name__}: {e}")
+            return
+        self.counts["delivered"] += 1
+        self._finish(job, "delivered", None)
+        if len(self._last_sent) > 10_000:
+            cutoff = time.monotonic() - self.per_user_interval
+            self._last_sent = {uid: t for uid, t in self._last_sent.items() if t > cutoff}
+
+    def _drop(self, job):
+        if not job.done.done():
+            job.done.set_result(False)
+        self._record(job, "dropped", "bot shut down")
+
+    def _finish(self, job, status, error):
+        if not job.done.done():
+            job.done.set_result(status == "delivered")
+        asyncio.get_running_loop().run_in_executor(None, self._record, job, status, error)
+
+    def _record(self, job, status, error):
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO dm_outcomes (kind, user_id, ref, status, attempts, error, queued_at, finished_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job.kind, job.user_id, job.ref, status, job.attempts, error, job.created_at, time.time()),
+                    )
+            except sqlite3.ProgrammingError:
+                pass  # connection already closed during shutdown
+
+    # ---- reporting ----
+    def failures(self, kind=None, limit=20):
+        query = "SELECT kind, user_id, ref, status, attempts, error, finished_at FROM dm_outcomes WHERE status != 'delivered'"
+        args = []
+        if kind:
+            query += " AND kind = ?"
+            args.append(kind)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            return self._conn.execute(query, args).fetchall()
+
+    def stats(self):
+        pending = (self._queue.qsize() if self._queue is not None else 0) + len(self._delayed)
+        return {**self.counts, "pending": pending}
@@ -0,0 +1,103 @@
+import asyncio
+from collections import deque
+
+# Discord's per-message limits
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+
+class EmbedBatcher:
+    """Buffers embeds per destination and sends them as multi-embed messages.
+
+    `add()` never waits on Discord: it appends to the destination's buffer
+    and, if a full message's worth is waiting, wakes the flusher early.
+    Otherwise buffers are flushed every `interval` seconds. Each message
+    carries at most `max_embeds` embeds totalling at most `max_chars`
+    (measured with len(embed), which discord.Embed implements).
+    `send(destination, embeds)` is the coroutine that delivers one message.
+    """
+
+    def __init__(self, send, interval=2.0, max_embeds=MAX_EMBEDS, max_chars=MAX_EMBED_CHARS):
+        self.send = send
+        self.interval = interval
+        self.max_embeds = max_embeds
+        self.max_chars = max_chars
+        self._buffers = {}  # destination -> deque of embeds
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.queued = 0
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.failed_embeds = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def add(self, destination, embed):
+        buffer = self._buffers.get(destination)
+        if buffer is None:
+            buffer = self._buffers[destination] = deque()
+        buffer.append(embed)
+        self.queued += 1
+        if len(buffer) >= self.max_embeds and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self):
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def _take_batch(self, buffer):
+        batch, chars = [], 0
+        while buffer and len(batch) < self.max_embeds:
+            size = len(buffer[0])
+            if batch and chars + size > self.max_chars:
+                break
+            batch.append(buffer.popleft())
+            chars += size
+        return batch
+
+    async def flush(self):
+        for destination, buffer in list(self._buffers.items()):
+            while buffer:
+                batch = self._take_batch(buffer)
+                try:
+                    await self.send(destination, batch)
+                    self.sent_messages += 1
+                    self.sent_embeds += len(batch)
+                except Exception as e:
+                    self.failed_embeds += len(batch)
+                    print(f"Embed batch to {destination} failed ({len(batch)} embeds dropped): {e}")
+            if not buffer:
+                self._buffers.pop(destination, None)
+
+    async def _run(self):
+        while True:
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            await self.flush()
+            # Entries added while the last flush was sending still go out before close() returns
+            if self._closing and not self.pending():
+                return
+
+    async def close(self):
+        """Send everything still buffered, then stop."""
+        self._closing = True
+        if self._task is not None and not self._task.done():
+            self._wakeup.set()
+            await self._task
+        else:
+            await self.flush()
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "pending": self.pending(),
+            "sent_messages": self.sent_messages,
+            "sent_embeds": self.sent_embeds,
+            "failed_embeds": self.failed_embeds,
+        }
@@ -0,0 +1,143 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+EXPIRY_COLUMNS = ("id", "kind", "guild_id", "user_id", "role_id", "due", "created_at")
+
+
+class ExpiryStore:
+    """On-disk index of pending reversals (temp bans, temp roles), ordered by due time.
+
+    One row per target: scheduling the same (kind, guild, user, role) again
+    replaces the old expiry. The `due` index makes "what's next" and "what's
+    overdue" single index seeks.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS expiries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "guild_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "role_id INTEGER NOT NULL DEFAULT 0, "
+            "due REAL NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "UNIQUE (kind, guild_id, user_id, role_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS expiries_due ON expiries (due)")
+        self._conn.commit()
+
+    def add(self, kind, guild_id, user_id, due, role_id=0):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO expiries (kind, guild_id, user_id, role_id, due, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, guild_id, user_id, role_id) DO UPDATE SET due = excluded.due",
+                (kind, guild_id, user_id, role_id, due, time.time()),
+            )
+
+    def cancel(self, kind, guild_id, user_id, role_id=0):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM expiries WHERE kind = ? AND guild_id = ? AND user_id = ? AND role_id = ?",
+                (kind, guild_id, user_id, role_id),
+            )
+        return cursor.rowcount > 0
+
+    def remove(self, expiry_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM expiries WHERE id = ?", (expiry_id,))
+
+    def reschedule(self, expiry_id, due):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE expiries SET due = ? WHERE id = ?", (due, expiry_id))
+
+    def next_due(self):
+        with self._lock:
+            return self._conn.execute("SELECT MIN(due) FROM expiries").fetchone()[0]
+
+    def due(self, now, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(EXPIRY_COLUMNS)} FROM expiries WHERE due <= ? ORDER BY due LIMIT ?", (now, limit)
+            ).fetchall()
+        return [dict(zip(EXPIRY_COLUMNS, row)) for row in rows]
+
+    def pending(self, guild_id, kind=None):
+        query = f"SELECT {', '.join(EXPIRY_COLUMNS)} FROM expiries WHERE guild_id = ?"
+        args = [guild_id]
+        if kind:
+            query += " AND kind = ?"
+            args.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY due", args).fetchall()
+        return [dict(zip(EXPIRY_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ExpiryWaiter:
+    """Sleeps until the store's earliest expiry, fires everything due, repeats.
+
+    `callback(row)` returns None when the row is finished (it is deleted) or a
+    new due time to retry later. Overdue rows, including ones that came due
+    while the bot was offline, fire on the first pass. Call `notify()` after
+    adding an expiry so an earlier one shortens the current sleep. Store
+    calls run on worker threads so SQLite never blocks the event loop; a
+    failing store is retried with backoff rather than ending the waiter.
+    """
+
+    def __init__(self, store, callback, clock=time.time, max_sleep=3600, retry_delay=1.0, max_retry_delay=60.0):
+        self.store = store
+        self.callback = callback
+        self.clock = clock
+        self.max_sleep = max_sleep  # re-check at least this often, in case the wall clock jumps
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _fire(self, row):
+        try:
+            retry_at = await self.callback(row)
+        except Exception as e:
+            print(f"Expiry {row['kind']} #{row['id']} failed: {e}")
+            retry_at = self.clock() + 60
+        try:
+            if retry_at is None:
+                await asyncio.to_thread(self.store.remove, row["id"])
+            else:
+                await asyncio.to_thread(self.store.reschedule, row["id"], retry_at)
+        except Exception as e:
+            # The row stays due and fires again; undoing a ban or role twice is harmless
+            print(f"Expiry #{row['id']}: couldn't update the store: {e}")
+
+    async def run(self):
+        delay = self.retry_delay
+        while True:
+            self._wakeup.clear()
+            try:
+                rows = await asyncio.to_thread(self.store.due, self.clock())
+                if rows:
+                    await asyncio.gather(*(self._fire(row) for row in rows))
+                    continue
+                next_due = await asyncio.to_thread(self.store.next_due)
+            except Exception as e:
+                print(f"Expiry waiter: store read failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            delay = self.retry_delay
+            timeout = self.max_sleep if next_due is None else min(self.max_sleep, max(0.0, next_due - self.clock()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
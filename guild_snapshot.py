@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+
+class GuildSnapshot:
+    __slots__ = ("id", "name", "owner_id", "icon_url", "created_at", "role_count", "channel_count", "version")
+
+    def __init__(self, guild_id, name, owner_id, icon_url, created_at, role_count, channel_count):
+        self.id = guild_id
+        self.name = name
+        self.owner_id = owner_id
+        self.icon_url = icon_url
+        self.created_at = created_at
+        self.role_count = role_count
+        self.channel_count = channel_count
+        self.version = 0
+
+
+class GuildSnapshots:
+    """Per-guild header facts kept current from guild, channel and role events.
+
+    Every change bumps the guild's `version`; members get their own version,
+    bumped on member/user updates. Renderers key their cache on these, so a
+    stale entry is simply never looked up again.
+    """
+
+    def __init__(self):
+        self._guilds = {}  # guild_id -> GuildSnapshot
+        self._member_versions = {}  # (guild_id, member_id) -> int
+
+    def build(self, guild_id, **fields):
+        old = self._guilds.get(guild_id)
+        snapshot = GuildSnapshot(guild_id, **fields)
+        # Keep versions increasing across rebuilds so cached renders can't resurrect
+        snapshot.version = old.version + 1 if old else 0
+        self._guilds[guild_id] = snapshot
+        return snapshot
+
+    def get(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def update(self, guild_id, **fields):
+        snapshot = self._guilds.get(guild_id)
+        if snapshot is None:
+            return
+        changed = False
+        for name, value in fields.items():
+            if getattr(snapshot, name) != value:
+                setattr(snapshot, name, value)
+                changed = True
+        if changed:
+            snapshot.version += 1
+
+    def adjust(self, guild_id, roles=0, channels=0):
+        snapshot = self._guilds.get(guild_id)
+        if snapshot is None:
+            return
+        snapshot.role_count = max(0, snapshot.role_count + roles)
+        snapshot.channel_count = max(0, snapshot.channel_count + channels)
+        snapshot.version += 1
+
+    def touch(self, guild_id):
+        """Invalidate everything rendered for a guild (e.g. a role was renamed)."""
+        snapshot = self._guilds.get(guild_id)
+        if snapshot is not None:
+            snapshot.version += 1
+
+    def drop(self, guild_id):
+        self._guilds.pop(guild_id, None)
+        self._member_versions = {k: v for k, v in self._member_versions.items() if k[0] != guild_id}
+
+    def member_version(self, guild_id, member_id):
+        return self._member_versions.get((guild_id, member_id), 0)
+
+    def touch_member(self, guild_id, member_id):
+        key = (guild_id, member_id)
+        self._member_versions[key] = self._member_versions.get(key, 0) + 1
+
+    def forget_member(self, guild_id, member_id):
+        # Renderers also key on joined_at, so a rejoin never matches an old render
+        self._member_versions.pop((guild_id, member_id), None)
+
+
+class RenderCache:
+    """Small LRU of rendered objects, each stored with the version it was built from."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
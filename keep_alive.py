@@ -1,15 +1,54 @@
-from flask import Flask
-from threading import Thread
+import json
+import os
 
-app = Flask('')
+from aiohttp import web
 
-@app.route('/')
-def home():
-    return "✅ Bot is alive!"
+# /healthz fails (-> supervisor restart) only when the bot is actually wedged
+MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", 5))
+MAX_GATEWAY_DOWN = float(os.getenv("HEALTH_MAX_GATEWAY_DOWN", 300))
+# /readyz fails (-> stop routing to this instance) when no gateway event has arrived for this long
+MAX_EVENT_AGE = float(os.getenv("HEALTH_MAX_EVENT_AGE", 600))
 
-def run():
-    app.run(host="0.0.0.0", port=8080)
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+def _json(body, status=200):
+    return web.Response(text=json.dumps(body), status=status, content_type="application/json")
+
+
+def build_app(health, metrics=None):
+    """`health()` returns a dict with ready, latency, last_event_age, gateway_down_for and loop_lag."""
+    app = web.Application()
+
+    async def home(request):
+        return web.Response(text="✅ Bot is alive!")
+
+    async def healthz(request):
+        state = health()
+        wedged = state["loop_lag"] > MAX_LOOP_LAG or state["gateway_down_for"] > MAX_GATEWAY_DOWN
+        return _json({**state, "ok": not wedged}, status=503 if wedged else 200)
+
+    async def readyz(request):
+        state = health()
+        ready = state["ready"] and state["latency"] is not None and state["last_event_age"] <= MAX_EVENT_AGE
+        return _json({**state, "ok": ready}, status=200 if ready else 503)
+
+    async def metrics_text(request):
+        if metrics is None:
+            return web.Response(status=404)
+        return web.Response(
+            body=metrics().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app.router.add_get("/", home)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics_text)
+    return app
+
+
+async def keep_alive(health, metrics=None, host="0.0.0.0", port=None):
+    """Start the web server on the running loop; returns the runner to clean up on shutdown."""
+    runner = web.AppRunner(build_app(health, metrics), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port or int(os.getenv("PORT", 8080)))
+    await site.start()
+    return runner
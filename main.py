@@ -1,24 +1,50 @@
+import time
+PROCESS_START = time.perf_counter()  # taken before the heavy imports so startup timing includes them
+
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands, File
 from discord.ui import View, Button
 from datetime import datetime, timedelta
-import time
 import os
 import asyncio
 import random
 import aiohttp
 import io
+import csv
 import pytz
 from dotenv import load_dotenv
 from keep_alive import keep_alive
 import re
-from collections import defaultdict
+import json
+import hashlib
+from collections import defaultdict, deque, OrderedDict
+from afk_store import AfkStore
+from giveaways import AliasTable, DueScheduler, GiveawayJournal, ParticipantSet
+from role_index import RoleIndex
+from timers import TimerEngine, TimerStore
+from qr_cache import QRCache
+from metrics import Metrics
+from guild_snapshot import GuildSnapshots, RenderCache
+from member_cache import MEMBER_CACHE_MODES, ActiveMemberCache, process_rss_bytes
+from antispam import SpamDetector
+from purge import PurgeFilter, PurgeJob
+from cases import CaseStore
+from expiries import ExpiryStore, ExpiryWaiter
+from receipts import ReceiptLedger
+from embed_batcher import EmbedBatcher
+from dm_queue import DMQueue, PRIORITY_MODERATION, PRIORITY_RECEIPT, PRIORITY_WELCOME
 
 import qrcode
 
 
-keep_alive()
+# -------------------- METRICS --------------------
+metrics = Metrics()
+metrics.describe("command_duration_seconds", "Prefix and slash command handler latency.")
+metrics.describe("event_duration_seconds", "Gateway event handler latency.")
+metrics.describe("rest_request_duration_seconds", "Outbound Discord REST call latency, rate-limit waits included.")
+metrics.describe("scheduler_job_duration_seconds", "Giveaway countdown and timer tick latency.")
+metrics.describe("event_loop_lag_seconds", "How late the event loop wakes a 0.5s sleeper.")
 
 # -------------------- CONFIG --------------------
 intents = discord.Intents.default()
@@ -38,35 +64,217 @@ SCRIPT_LOG_ID_CHANNEL= 1443591110642499594
 SUPPORT_CHANNEL_ID = 1443442650673057894
 MOD_LOG_CHANNEL_ID = 1453322866199367741
 
+# Local storage
+DATA_DIR = os.getenv("DATA_DIR", "data")
+os.makedirs(DATA_DIR, exist_ok=True)
+AFK_TTL_SECONDS = int(os.getenv("AFK_TTL_SECONDS", 7 * 86400))  # 0 = never expire
+AFK_FLUSH_SECONDS = int(os.getenv("AFK_FLUSH_SECONDS", 5))
+GIVEAWAY_SYNC_SECONDS = int(os.getenv("GIVEAWAY_SYNC_SECONDS", 2))
+TIMER_MAX_PER_USER = int(os.getenv("TIMER_MAX_PER_USER", 5))
+TIMER_MAX_PER_GUILD = int(os.getenv("TIMER_MAX_PER_GUILD", 100))
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+STATUS_ROTATE_SECONDS = int(os.getenv("STATUS_ROTATE_SECONDS", 60))
+PRESENCE_MIN_GAP = int(os.getenv("PRESENCE_MIN_GAP", 30))  # seconds between presence updates
+QR_CACHE_MB = float(os.getenv("QR_CACHE_MB", 8))
+QR_PREWARM_AMOUNTS = [int(a) for a in os.getenv("QR_PREWARM_AMOUNTS", "49,99,199").split(",") if a.strip()]
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", 4))  # in-flight single deletes per purge
+PURGE_MAX_SCAN = int(os.getenv("PURGE_MAX_SCAN", 100_000))  # per channel, for filtered purges
+PURGE_PROGRESS_SECONDS = float(os.getenv("PURGE_PROGRESS_SECONDS", 3))
+MOD_LOG_FLUSH_SECONDS = float(os.getenv("MOD_LOG_FLUSH_SECONDS", 2))
+DM_WORKERS = int(os.getenv("DM_WORKERS", 3))
+DM_RATE_PER_SECOND = float(os.getenv("DM_RATE_PER_SECOND", 5))
+DM_BEFORE_ACTION_TIMEOUT = float(os.getenv("DM_BEFORE_ACTION_TIMEOUT", 3))  # max wait for a DM before ban/kick
+
 # Staff IDs
 STAFF_IDS = [1314811739837038675 , 
              1303751390505734174,
         ]  # Add more IDs as needed
 
+# Member cache: "full" caches and chunks every member at startup; "lazy" skips
+# chunking and caches members as they join or are fetched; "active" keeps only
+# recently active members and staff in a bounded LRU.
+MEMBER_CACHE_MODE = os.getenv("MEMBER_CACHE_MODE", "full").lower()
+if MEMBER_CACHE_MODE not in MEMBER_CACHE_MODES:
+    raise ValueError(f"MEMBER_CACHE_MODE must be one of {', '.join(MEMBER_CACHE_MODES)}")
+ACTIVE_MEMBER_CACHE_SIZE = int(os.getenv("ACTIVE_MEMBER_CACHE_SIZE", 5000))
 
+# Anti-spam
+ANTISPAM_ENABLED = os.getenv("ANTISPAM_ENABLED", "1") == "1"
+SPAM_MAX_MESSAGES = int(os.getenv("SPAM_MAX_MESSAGES", 6))  # ...within SPAM_WINDOW_SECONDS
+SPAM_WINDOW_SECONDS = float(os.getenv("SPAM_WINDOW_SECONDS", 5))
+SPAM_MAX_DUPLICATES = int(os.getenv("SPAM_MAX_DUPLICATES", 3))  # ...within SPAM_DUPLICATE_WINDOW
+SPAM_DUPLICATE_WINDOW = float(os.getenv("SPAM_DUPLICATE_WINDOW", 30))
+SPAM_IDLE_SECONDS = float(os.getenv("SPAM_IDLE_SECONDS", 300))
+SPAM_TIMEOUT_MINUTES = int(os.getenv("SPAM_TIMEOUT_MINUTES", 10))
 
 
-user_message_cache = defaultdict(list)
 # -------------------- BOT INIT --------------------
-bot = commands.Bot(command_prefix=PREFIX, intents=intents , help_command=None)
+shutdown_hooks = []  # async callables run before the gateway connection closes
+
+class StoreBot(commands.Bot):
+    async def setup_hook(self):
+        # Runs once on the bot's own loop before the gateway connects
+        web_runner = await keep_alive(health_snapshot, metrics.render)
+        shutdown_hooks.append(web_runner.cleanup)
+        spawn(metrics.sample_loop_lag())
+        dm_queue.start()
+        log_batcher.start()
+        register_giveaway_views()
+
+    def event(self, coro):
+        # Every @bot.event handler is timed under its own name, so none can be missed
+        return super().event(metrics.timed("event_duration_seconds", event=coro.__name__)(coro))
+
+    def dispatch(self, event_name, /, *args, **kwargs):
+        # Every gateway event passes through here; a plain assignment, no task per event
+        global last_event_at
+        last_event_at = time.monotonic()
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def close(self):
+        for hook in shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                print(f"Shutdown hook failed: {e}")
+        await super().close()
+
+class InstrumentedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        interaction.extras["metrics_start"] = time.perf_counter()
+        remember_member(interaction.user)
+        return True
+
+    async def on_error(self, interaction, error):
+        observe_app_command(interaction)
+        await super().on_error(interaction, error)
+
+def observe_app_command(interaction, name=None):
+    start = interaction.extras.pop("metrics_start", None)
+    if start is not None:
+        name = name or (interaction.command.qualified_name if interaction.command else "unknown")
+        metrics.observe("command_duration_seconds", time.perf_counter() - start, command=name, kind="slash")
+
+def instrument_http(http):
+    request = http.request
+
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        finally:
+            # route.path is the template ("/channels/{channel_id}/messages"), so label cardinality stays small
+            metrics.observe(
+                "rest_request_duration_seconds", time.perf_counter() - start, method=route.method, route=route.path
+            )
+
+    http.request = timed_request
+
+def member_cache_options(mode):
+    if mode == "full":
+        return {"member_cache_flags": discord.MemberCacheFlags.from_intents(intents), "chunk_guilds_at_startup": True}
+    if mode == "lazy":
+        return {"member_cache_flags": discord.MemberCacheFlags.from_intents(intents), "chunk_guilds_at_startup": False}
+    # active: discord.py caches nobody but the bot itself; ActiveMemberCache holds the rest
+    return {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+
+active_members = ActiveMemberCache(ACTIVE_MEMBER_CACHE_SIZE)
+
+def remember_member(member):
+    if MEMBER_CACHE_MODE != "full" and isinstance(member, discord.Member):
+        active_members.touch(member)
+
+bot = StoreBot(
+    command_prefix=PREFIX, intents=intents , help_command=None, tree_cls=InstrumentedTree,
+    **member_cache_options(MEMBER_CACHE_MODE),
+)
+instrument_http(bot.http)
+
+# The event loop only holds weak references to tasks; keep fire-and-forget ones
+# alive here until they finish, or they can be garbage-collected mid-run.
+background_tasks = set()
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_task_done)
+    return task
+
+def background_task_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_coro().__qualname__} failed: {task.exception()!r}")
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.metrics_start = time.perf_counter()
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    start = getattr(ctx, "metrics_start", None)
+    if start is not None:
+        metrics.observe(
+            "command_duration_seconds", time.perf_counter() - start, command=ctx.command.qualified_name, kind="prefix"
+        )
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    observe_app_command(interaction, command.qualified_name)
+
+# -------------------- HEALTH --------------------
+last_event_at = time.monotonic()  # updated inline by StoreBot.dispatch
+gateway_down_since = time.monotonic()  # None while connected
+
+@bot.event
+async def on_connect():
+    global gateway_down_since
+    gateway_down_since = None
+
+@bot.event
+async def on_resumed():
+    global gateway_down_since
+    gateway_down_since = None
+
+@bot.event
+async def on_disconnect():
+    global gateway_down_since
+    if gateway_down_since is None:
+        gateway_down_since = time.monotonic()
+
+def health_snapshot():
+    now = time.monotonic()
+    latency = bot.latency
+    return {
+        "ready": bot.is_ready() and not bot.is_closed(),
+        "latency": latency if latency == latency and latency != float("inf") else None,
+        "last_event_age": round(now - last_event_at, 3),
+        "gateway_down_for": round(now - gateway_down_since, 3) if gateway_down_since is not None else 0.0,
+        "loop_lag": metrics.last_gauge("event_loop_lag_seconds_last", 0.0),
+        "guilds": len(bot.guilds),
+    }
 
 # -------------------- AFK DATA --------------------
-afk_data = {}  # {guild_id: {user_id: {"reason": str, "time": float}}}
+afk_store = AfkStore(os.path.join(DATA_DIR, "afk.db"), ttl=AFK_TTL_SECONDS)
 
 def set_afk(guild_id, user_id, reason):
-    if guild_id not in afk_data:
-        afk_data[guild_id] = {}
-    afk_data[guild_id][user_id] = {
-        "reason": reason,
-        "time": time.time()
-    }
+    afk_store.set(guild_id, user_id, reason)
 
 def remove_afk(guild_id, user_id):
-    if guild_id in afk_data and user_id in afk_data[guild_id]:
-        del afk_data[guild_id][user_id]
+    return afk_store.remove(guild_id, user_id)
 
 def is_afk(guild_id, user_id):
-    return guild_id in afk_data and user_id in afk_data[guild_id]
+    return afk_store.get(guild_id, user_id) is not None
+
+@tasks.loop(seconds=AFK_FLUSH_SECONDS)
+async def afk_maintenance():
+    afk_store.expire()
+    await afk_store.flush()
+
+async def close_afk_store():
+    afk_maintenance.cancel()
+    await afk_store.aclose()
+
+shutdown_hooks.append(close_afk_store)
 
 def format_duration(seconds):
     mins, secs = divmod(int(seconds), 60)
@@ -85,44 +293,209 @@ def format_duration(seconds):
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
+    # The member cache is rebuilt on every (re)connect, so re-index each time
+    for guild in bot.guilds:
+        if guild.chunked:
+            index_guild_roles(guild)
+        snapshot_guild(guild)
+    recount_members()
+
+    # on_ready fires again after gateway reconnects; the rest runs once per process
+    global startup_done
+    if startup_done:
+        print("Reconnected - startup work already done.")
+        return
+    startup_done = True
+
+    synced = await sync_commands_if_changed()
+    afk_maintenance.start()
+    antispam_maintenance.start()
+    # First pass also catches up on expiries that came due while we were offline
+    spawn(expiry_waiter.run())
+    if MEMBER_CACHE_MODE != "full":
+        spawn(cache_staff_members())
+    restore_giveaways()
+    spawn(giveaway_scheduler.run())
+    giveaway_journal_maintenance.start()
+    for timer_id in running_timers:
+        timer_engine.schedule(timer_id, time.time())
+    timer_engine.start()
+    spawn(qr_cache.prewarm([upi_payload(amount) for amount in QR_PREWARM_AMOUNTS]))
+    spawn(rotate_status())
+    print("Status rotation started!")
+    print(
+        f"{'Cold' if synced else 'Warm'} startup: ready in {time.perf_counter() - PROCESS_START:.2f}s "
+        f"(slash command sync {'ran' if synced else 'skipped'})."
+    )
+
+startup_done = False
+
+# -------------------- COMMAND SYNC --------------------
+COMMAND_TREE_HASH_PATH = os.path.join(DATA_DIR, "command_tree.sha256")
+
+def command_tree_fingerprint():
+    payload = []
+    for command in bot.tree.get_commands():
+        try:
+            payload.append(command.to_dict(bot.tree))
+        except TypeError:  # discord.py < 2.4
+            payload.append(command.to_dict())
+    payload.sort(key=lambda c: (c.get("type", 1), c["name"]))
+    blob = json.dumps({"application_id": bot.application_id, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+async def sync_commands_if_changed():
+    """Sync slash commands only when the tree differs from the last successful sync."""
+    fingerprint = command_tree_fingerprint()
+    try:
+        with open(COMMAND_TREE_HASH_PATH) as f:
+            stored = f.read().strip()
+    except OSError:
+        stored = None
+    if stored == fingerprint and not FORCE_COMMAND_SYNC:
+        print("Slash commands unchanged, skipping sync.")
+        return False
+    start = time.perf_counter()
     try:
         await bot.tree.sync()
-        print("Slash commands synced.")
     except Exception as e:
-        print(e)
-    bot.loop.create_task(rotate_status())
-    print("Status rotation started!")
+        # Fingerprint left as-is, so the next start tries again
+        print(f"Slash command sync failed: {e}")
+        return False
+    with open(COMMAND_TREE_HASH_PATH, "w") as f:
+        f.write(fingerprint)
+    print(f"Slash commands synced in {time.perf_counter() - start:.2f}s.")
+    return True
+
+# -------------------- ROLE INDEX --------------------
+role_index = RoleIndex()
+
+def index_guild_roles(guild):
+    role_index.build(guild.id, ((m.id, [r.id for r in m.roles]) for m in guild.members))
+
+def held_roles(guild_id, member, role_ids):
+    """The subset of `role_ids` the member has, answered from the index without walking member.roles."""
+    missing = role_index.missing_roles(guild_id, member.id, role_ids)
+    if missing is None:  # guild not indexed yet; the interaction payload carries the roles
+        return {role.id for role in getattr(member, "roles", ())}.intersection(role_ids)
+    return set(role_ids).difference(missing)
 
 @bot.event
-async def on_message(message):
-    if message.author.bot:
-        return
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        role_index.update_member(
+            after.guild.id, after.id, [r.id for r in before.roles], [r.id for r in after.roles]
+        )
+    guild_snapshots.touch_member(after.guild.id, after.id)
+
+@bot.event
+async def on_member_remove(member):
+    # Only fires for cached members; bookkeeping every leave needs is in on_raw_member_remove
+    role_index.remove_member(member.guild.id, member.id, [r.id for r in member.roles])
 
+@bot.event
+async def on_raw_member_remove(payload):
+    adjust_member_count(payload.guild_id, -1)
+    guild_snapshots.forget_member(payload.guild_id, payload.user.id)
+    active_members.discard(payload.guild_id, payload.user.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    role_index.remove_role(role.guild.id, role.id)
+    guild_snapshots.adjust(role.guild.id, roles=-1)
+
+afk_path_stats = {"fast": 0, "slow": 0}
+
+async def handle_afk(message, afk_users):
     guild_id = message.guild.id
-    user_id = message.author.id
+    now = time.time()
 
     # ---- AFK REMOVE ----
-    if is_afk(guild_id, user_id):
-        start_time = afk_data[guild_id][user_id]["time"]
-        reason = afk_data[guild_id][user_id]["reason"]
-        afk_seconds = time.time() - start_time
-        remove_afk(guild_id, user_id)
+    if message.author.id in afk_users:
+        reason, start_time = remove_afk(guild_id, message.author.id)
         await message.channel.send(
             f"🟢 **{message.author.display_name}** is back!\n"
-            f"⏱ AFK Duration: **{format_duration(afk_seconds)}**\n"
+            f"⏱ AFK Duration: **{format_duration(now - start_time)}**\n"
             f"📌 Reason was: {reason}"
         )
 
     # ---- AFK MENTION CHECK ----
+    notices = []
+    seen = set()
     for user in message.mentions:
-        if is_afk(guild_id, user.id):
-            data = afk_data[guild_id][user.id]
-            duration = format_duration(time.time() - data["time"])
-            await message.reply(
-                f"⚠️ **{user.display_name}** is AFK!\n"
-                f"📌 Reason: {data['reason']}\n"
-                f"⏱ AFK for: **{duration}**"
-            )
+        data = afk_users.get(user.id)
+        if data is None or user.id in seen:
+            continue
+        seen.add(user.id)
+        reason, since = data
+        notices.append(
+            f"⚠️ **{user.display_name}** is AFK!\n"
+            f"📌 Reason: {reason}\n"
+            f"⏱ AFK for: **{format_duration(now - since)}**"
+        )
+    if not notices:
+        return
+
+    # One reply per message, split only if it would exceed Discord's 2000-char limit
+    chunk = ""
+    for notice in notices:
+        if chunk and len(chunk) + len(notice) + 2 > 2000:
+            await message.reply(chunk)
+            chunk = ""
+        chunk = f"{chunk}\n\n{notice}" if chunk else notice
+    await message.reply(chunk)
+
+# -------------------- ANTI-SPAM --------------------
+spam_detector = SpamDetector(
+    max_messages=SPAM_MAX_MESSAGES,
+    window=SPAM_WINDOW_SECONDS,
+    max_duplicates=SPAM_MAX_DUPLICATES,
+    duplicate_window=SPAM_DUPLICATE_WINDOW,
+    idle_seconds=SPAM_IDLE_SECONDS,
+    punish_cooldown=SPAM_TIMEOUT_MINUTES * 60,  # the timeout itself; later hits would only repeat it
+)
+
+def spam_exempt(member):
+    return member.id in STAFF_IDS or member.guild_permissions.manage_messages
+
+async def punish_spam(member, reason):
+    guild = member.guild
+    me = guild.me
+    if member.top_role >= me.top_role or member.id == guild.owner_id:
+        print(f"Anti-spam: can't timeout {member} in {guild} ({reason})")
+        return
+    try:
+        await apply_timeout(guild, me, member, SPAM_TIMEOUT_MINUTES, f"Auto anti-spam: {reason}")
+    except discord.HTTPException as e:
+        print(f"Anti-spam timeout failed for {member}: {e}")
+
+@tasks.loop(seconds=60)
+async def antispam_maintenance():
+    spam_detector.evict_idle()
+
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    remember_member(message.author)
+
+    # ---- ANTI-SPAM ----
+    if ANTISPAM_ENABLED and message.guild and isinstance(message.author, discord.Member):
+        if not spam_exempt(message.author):
+            violation = spam_detector.check((message.guild.id, message.author.id), message.content)
+            if violation:
+                # Timeout runs in the background; the spammer's message gets no further handling
+                spawn(punish_spam(message.author, violation))
+                return
+
+    # ---- AFK ----
+    # Most messages come from guilds with nobody AFK; one dict lookup settles those.
+    afk_users = afk_store.guild_users(message.guild.id) if message.guild else None
+    if afk_users:
+        afk_path_stats["slow"] += 1
+        await handle_afk(message, afk_users)
+    else:
+        afk_path_stats["fast"] += 1
 
     # Process commands
     await bot.process_commands(message)
@@ -143,19 +516,76 @@ async def on_message(message):
 
 
 # -------------------- STATUS ROTATION --------------------
-fun_texts = [
+# Texts come from data/status_texts.txt (one per line, re-read when it changes),
+# else STATUS_TEXTS ("a|b|c"), else these defaults.
+DEFAULT_FUN_TEXTS = [
     "Debugging myself 🐞", "looking for orders!!" , "need help?? ping me!!"
 ]
+STATUS_TEXTS_PATH = os.path.join(DATA_DIR, "status_texts.txt")
+fun_texts = [t.strip() for t in os.getenv("STATUS_TEXTS", "").split("|") if t.strip()] or DEFAULT_FUN_TEXTS
+fun_texts_mtime = None
+
+def reload_fun_texts():
+    global fun_texts, fun_texts_mtime
+    try:
+        mtime = os.path.getmtime(STATUS_TEXTS_PATH)
+    except OSError:
+        return
+    if mtime != fun_texts_mtime:
+        fun_texts_mtime = mtime
+        with open(STATUS_TEXTS_PATH, encoding="utf-8") as f:
+            fun_texts = [line.strip() for line in f if line.strip()] or fun_texts
+
+# Kept from join/leave events instead of summing member_count on every update
+guild_member_counts = {}
+presence_wakeup = asyncio.Event()
+
+def recount_members():
+    guild_member_counts.clear()
+    for guild in bot.guilds:
+        guild_member_counts[guild.id] = guild.member_count or 0
+    presence_wakeup.set()
+
+def adjust_member_count(guild_id, delta):
+    guild_member_counts[guild_id] = guild_member_counts.get(guild_id, 0) + delta
+    presence_wakeup.set()
 
 async def rotate_status():
+    """Alternate member count / fun text, sending a presence update only when the text changes."""
     await bot.wait_until_ready()
+    loop = asyncio.get_running_loop()
+    show_members = True
+    fun_text = random.choice(fun_texts)
+    last_text = None
+    last_sent_at = -PRESENCE_MIN_GAP
+    next_rotation = loop.time() + STATUS_ROTATE_SECONDS
     while not bot.is_closed():
-        total_members = sum(g.member_count for g in bot.guilds)
-        await bot.change_presence(activity=discord.Game(name=f"Members: {total_members}"))
-        await asyncio.sleep(10)
-        random_text = random.choice(fun_texts)
-        await bot.change_presence(activity=discord.Game(name=random_text))
-        await asyncio.sleep(10)
+        presence_wakeup.clear()
+        text = f"Members: {sum(guild_member_counts.values())}" if show_members else fun_text
+        if text != last_text:
+            gap = last_sent_at + PRESENCE_MIN_GAP - loop.time()
+            if gap > 0:
+                await asyncio.sleep(gap)
+                continue  # recompute - the count may have moved again meanwhile
+            try:
+                await bot.change_presence(activity=discord.Game(name=text))
+                last_text = text
+            except Exception as e:
+                print(f"Presence update failed: {e}")
+            last_sent_at = loop.time()
+
+        timeout = next_rotation - loop.time()
+        if timeout <= 0:
+            show_members = not show_members
+            if not show_members:
+                reload_fun_texts()
+                fun_text = random.choice(fun_texts)
+            next_rotation = loop.time() + STATUS_ROTATE_SECONDS
+            continue
+        try:
+            await asyncio.wait_for(presence_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
 # -------------------- PREFIX COMMANDS --------------------
 @bot.command()
@@ -166,6 +596,56 @@ async def afk(ctx, *, reason="AFK"):
 def staff_only(ctx):
     return ctx.author.id in STAFF_IDS
 
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+@bot.command(name="afk_stats")
+async def afk_stats(ctx):
+    if not staff_only(ctx):
+        return await ctx.send("❌ You are not allowed to use this command.")
+    stats = afk_store.stats()
+    ttl = format_duration(afk_store.ttl) if afk_store.ttl else "never"
+    await ctx.send(
+        f"💤 **AFK Store**\n"
+        f"Entries: **{stats['entries']}** in {stats['guilds']} server(s)\n"
+        f"Pending writes: {stats['pending_writes']}\n"
+        f"Messages: {afk_path_stats['fast']} fast path / {afk_path_stats['slow']} slow path\n"
+        f"Memory: {format_bytes(stats['memory_bytes'])} | Disk: {format_bytes(stats['disk_bytes'])}\n"
+        f"Expiry: {ttl}"
+    )
+
+# -------------------- MEMBER CACHE --------------------
+async def cache_staff_members():
+    """Pin staff into the active-member cache so permission checks never need a fetch."""
+    for guild in bot.guilds:
+        for user_id in STAFF_IDS:
+            member = guild.get_member(user_id)
+            if member is None:
+                try:
+                    member = await guild.fetch_member(user_id)
+                except discord.HTTPException:
+                    continue
+            active_members.pin(member)
+
+@bot.command(name="memory")
+async def memory_report(ctx):
+    if not staff_only(ctx):
+        return await ctx.send("❌ You are not allowed to use this command.")
+    rss = process_rss_bytes()
+    cached_members = sum(len(guild.members) for guild in bot.guilds)
+    total_members = sum(guild_member_counts.values())
+    await ctx.send(
+        f"🧠 **Memory** (member cache: `{MEMBER_CACHE_MODE}`)\n"
+        f"RSS: **{format_bytes(rss) if rss is not None else 'unknown'}**\n"
+        f"Members cached: **{cached_members}** of {total_members} | Active cache: {len(active_members)}\n"
+        f"Users: {len(bot.users)} | Messages: {len(bot.cached_messages)} | Guilds: {len(bot.guilds)}\n"
+        f"Role index: {len(role_index)} entries | Anti-spam: {len(spam_detector)} users\n"
+        f"AFK: {format_bytes(afk_store.memory_bytes())} | QR cache: {format_bytes(qr_cache.stats()['bytes'])}"
+    )
+
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
@@ -247,119 +727,274 @@ async def thanks_slash(interaction: discord.Interaction):
     await interaction.response.send_message("✅ Thanks message sent.", ephemeral=True)
     await send_simple_thanks(interaction.channel)
 
-# -------------------- SERVER INFO --------------------
+# -------------------- SERVER / MEMBER INFO --------------------
+# Header facts come from a snapshot kept current by guild/channel/role events,
+# and finished embeds are cached against the snapshot + member versions. The
+# prefix and slash commands share these builders so they always render alike.
+guild_snapshots = GuildSnapshots()
+info_embeds = RenderCache(max_entries=512)
+
+def format_datetime(dt):
+    return dt.strftime("%d %b %Y %H:%M:%S") if dt else "Unknown"
+
+def snapshot_guild(guild):
+    return guild_snapshots.build(
+        guild.id,
+        name=guild.name,
+        owner_id=guild.owner_id,
+        icon_url=guild.icon.url if guild.icon else None,
+        created_at=guild.created_at,
+        role_count=len(guild.roles),
+        channel_count=len(guild.channels),
+    )
+
+def guild_snapshot(guild):
+    return guild_snapshots.get(guild.id) or snapshot_guild(guild)
+
+def live_member_count(guild):
+    return guild_member_counts.get(guild.id, guild.member_count)
+
+def member_render_version(member, snapshot):
+    # Keyed on the rendered fields themselves: member_update only fires for cached
+    # members, so with a partial member cache the events alone would miss changes.
+    # joined_at changes on rejoin, so a returning member never gets a stale render.
+    return (
+        snapshot.version,
+        guild_snapshots.member_version(member.guild.id, member.id),
+        str(member),
+        member.display_name,
+        member.top_role.id,
+        member.display_avatar.key,
+        member.joined_at,
+    )
+
+def add_member_fields(embed, member, inline):
+    embed.set_thumbnail(url=member.display_avatar.url)
+    embed.add_field(name="ID", value=member.id, inline=inline)
+    embed.add_field(name="Display Name", value=member.display_name, inline=inline)
+    embed.add_field(name="Bot?", value=member.bot, inline=inline)
+    embed.add_field(name="Top Role", value=member.top_role, inline=inline)
+    embed.add_field(name="Joined Server", value=format_datetime(member.joined_at), inline=inline)
+    embed.add_field(name="Account Created", value=format_datetime(member.created_at), inline=inline)
+
+SERVER_MEMBERS_FIELD = 2
+DETAILED_MEMBERS_FIELD = 8
+
+def build_server_info_embed(snapshot):
+    embed = discord.Embed(title=f"Server Info: {snapshot.name}", color=discord.Color.blurple())
+    if snapshot.icon_url:
+        embed.set_thumbnail(url=snapshot.icon_url)
+    embed.add_field(name="Server ID", value=snapshot.id, inline=False)
+    embed.add_field(name="Owner", value=f"<@{snapshot.owner_id}>" if snapshot.owner_id else "Unknown", inline=False)
+    embed.add_field(name="Members", value=0, inline=False)  # SERVER_MEMBERS_FIELD, filled per send
+    embed.add_field(name="Roles", value=snapshot.role_count, inline=False)
+    embed.add_field(name="Channels", value=snapshot.channel_count, inline=False)
+    embed.add_field(name="Created On", value=format_datetime(snapshot.created_at), inline=False)
+    return embed
+
+def build_member_info_embed(member):
+    embed = discord.Embed(title=f"Member Info: {member}", color=discord.Color.green())
+    add_member_fields(embed, member, inline=False)
+    return embed
+
+def build_detailed_info_embed(member, snapshot):
+    embed = discord.Embed(title=f"Detailed Info: {member}", color=discord.Color.purple())
+    add_member_fields(embed, member, inline=True)
+    embed.add_field(name="Server Name", value=snapshot.name, inline=True)
+    embed.add_field(name="Server ID", value=snapshot.id, inline=True)
+    embed.add_field(name="Total Members", value=0, inline=True)  # DETAILED_MEMBERS_FIELD, filled per send
+    return embed
+
+def server_info_embed(guild):
+    snapshot = guild_snapshot(guild)
+    # Patch a copy: the cached embed is shared by every caller
+    embed = info_embeds.get(("server", guild.id), snapshot.version, lambda: build_server_info_embed(snapshot)).copy()
+    # The member count moves on every join/leave; patch it in rather than invalidating
+    embed.set_field_at(SERVER_MEMBERS_FIELD, name="Members", value=live_member_count(guild), inline=False)
+    embed.timestamp = discord.utils.utcnow()
+    return embed
+
+def member_info_embed(member):
+    snapshot = guild_snapshot(member.guild)
+    embed = info_embeds.get(
+        ("member", member.guild.id, member.id),
+        member_render_version(member, snapshot),
+        lambda: build_member_info_embed(member),
+    ).copy()
+    embed.timestamp = discord.utils.utcnow()
+    return embed
+
+def detailed_info_embed(member):
+    snapshot = guild_snapshot(member.guild)
+    embed = info_embeds.get(
+        ("detailed", member.guild.id, member.id),
+        member_render_version(member, snapshot),
+        lambda: build_detailed_info_embed(member, snapshot),
+    ).copy()
+    embed.set_field_at(DETAILED_MEMBERS_FIELD, name="Total Members", value=live_member_count(member.guild), inline=True)
+    embed.timestamp = discord.utils.utcnow()
+    return embed
+
+@bot.event
+async def on_guild_update(before, after):
+    guild_snapshots.update(
+        after.id,
+        name=after.name,
+        owner_id=after.owner_id,
+        icon_url=after.icon.url if after.icon else None,
+    )
+
+@bot.event
+async def on_guild_channel_create(channel):
+    guild_snapshots.adjust(channel.guild.id, channels=1)
+
+@bot.event
+async def on_guild_role_create(role):
+    guild_snapshots.adjust(role.guild.id, roles=1)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    # A rename or reorder can change any member's "Top Role"
+    if before.name != after.name or before.position != after.position:
+        guild_snapshots.touch(after.guild.id)
+
+@bot.event
+async def on_user_update(before, after):
+    for guild in after.mutual_guilds:
+        guild_snapshots.touch_member(guild.id, after.id)
+
 @bot.command(name="server_info")
 async def server_info_cmd(ctx):
     if not staff_only(ctx):
         return await ctx.send("❌ You are not allowed to use this command.")
-    guild = ctx.guild
-    embed = discord.Embed(title=f"Server Info: {guild.name}", color=discord.Color.blurple(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=guild.icon.url if guild.icon else discord.Embed.Empty)
-    embed.add_field(name="Server ID", value=guild.id, inline=False)
-    embed.add_field(name="Owner", value=guild.owner, inline=False)
-    embed.add_field(name="Members", value=guild.member_count, inline=False)
-    embed.add_field(name="Roles", value=len(guild.roles), inline=False)
-    embed.add_field(name="Channels", value=len(guild.channels), inline=False)
-    embed.add_field(name="Created On", value=guild.created_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    await ctx.send(embed=embed)
+    await ctx.send(embed=server_info_embed(ctx.guild))
 
 @bot.tree.command(name="server_info", description="Get detailed server info")
 async def server_info_slash(interaction: discord.Interaction):
     if not staff_only_slash(interaction):
         return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
-    guild = interaction.guild
-    embed = discord.Embed(title=f"Server Info: {guild.name}", color=discord.Color.blurple(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=guild.icon.url if guild.icon else discord.Embed.Empty)
-    embed.add_field(name="Server ID", value=guild.id, inline=False)
-    embed.add_field(name="Owner", value=guild.owner, inline=False)
-    embed.add_field(name="Members", value=guild.member_count, inline=False)
-    embed.add_field(name="Roles", value=len(guild.roles), inline=False)
-    embed.add_field(name="Channels", value=len(guild.channels), inline=False)
-    embed.add_field(name="Created On", value=guild.created_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    await interaction.response.send_message(embed=embed)
-
-# -------------------- MEMBER INFO --------------------
+    await interaction.response.send_message(embed=server_info_embed(interaction.guild))
+
 @bot.command(name="member_info")
 async def member_info_cmd(ctx, member: discord.Member = None):
     if not staff_only(ctx):
         return await ctx.send("❌ You are not allowed to use this command.")
-    member = member or ctx.author
-    embed = discord.Embed(title=f"Member Info: {member}", color=discord.Color.green(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="ID", value=member.id, inline=False)
-    embed.add_field(name="Display Name", value=member.display_name, inline=False)
-    embed.add_field(name="Bot?", value=member.bot, inline=False)
-    embed.add_field(name="Top Role", value=member.top_role, inline=False)
-    embed.add_field(name="Joined Server", value=member.joined_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    embed.add_field(name="Account Created", value=member.created_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    await ctx.send(embed=embed)
+    await ctx.send(embed=member_info_embed(member or ctx.author))
 
 @bot.tree.command(name="member_info", description="Get detailed member info")
 @app_commands.describe(member="The member to get info for")
 async def member_info_slash(interaction: discord.Interaction, member: discord.Member = None):
     if not staff_only_slash(interaction):
         return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
-    member = member or interaction.user
-    embed = discord.Embed(title=f"Member Info: {member}", color=discord.Color.green(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="ID", value=member.id, inline=False)
-    embed.add_field(name="Display Name", value=member.display_name, inline=False)
-    embed.add_field(name="Bot?", value=member.bot, inline=False)
-    embed.add_field(name="Top Role", value=member.top_role, inline=False)
-    embed.add_field(name="Joined Server", value=member.joined_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    embed.add_field(name="Account Created", value=member.created_at.strftime("%d %b %Y %H:%M:%S"), inline=False)
-    await interaction.response.send_message(embed=embed)
-
-# -------------------- DETAILED INFO --------------------
+    await interaction.response.send_message(embed=member_info_embed(member or interaction.user))
+
 @bot.command(name="detailed_info")
 async def detailed_info_cmd(ctx, member: discord.Member = None):
     if not staff_only(ctx):
         return await ctx.send("❌ You are not allowed to use this command.")
-    member = member or ctx.author
-    guild = ctx.guild
-    embed = discord.Embed(title=f"Detailed Info: {member}", color=discord.Color.purple(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="ID", value=member.id, inline=True)
-    embed.add_field(name="Display Name", value=member.display_name, inline=True)
-    embed.add_field(name="Bot?", value=member.bot, inline=True)
-    embed.add_field(name="Top Role", value=member.top_role, inline=True)
-    embed.add_field(name="Joined Server", value=member.joined_at.strftime("%d %b %Y %H:%M:%S"), inline=True)
-    embed.add_field(name="Account Created", value=member.created_at.strftime("%d %b %Y %H:%M:%S"), inline=True)
-    embed.add_field(name="Server Name", value=guild.name, inline=True)
-    embed.add_field(name="Server ID", value=guild.id, inline=True)
-    embed.add_field(name="Total Members", value=guild.member_count, inline=True)
-    await ctx.send(embed=embed)
+    await ctx.send(embed=detailed_info_embed(member or ctx.author))
 
 @bot.tree.command(name="detailed_info", description="Get detailed info about a member + server")
 @app_commands.describe(member="The member to get detailed info for")
 async def detailed_info_slash(interaction: discord.Interaction, member: discord.Member = None):
     if not staff_only_slash(interaction):
         return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
-    member = member or interaction.user
-    guild = interaction.guild
-    embed = discord.Embed(title=f"Detailed Info: {member}", color=discord.Color.purple(), timestamp=datetime.utcnow())
-    embed.set_thumbnail(url=member.display_avatar.url)
-    embed.add_field(name="ID", value=member.id, inline=True)
-    embed.add_field(name="Display Name", value=member.display_name, inline=True)
-    embed.add_field(name="Bot?", value=member.bot, inline=True)
-    embed.add_field(name="Top Role", value=member.top_role, inline=True)
-    embed.add_field(name="Joined Server", value=member.joined_at.strftime("%d %b %Y %H:%M:%S"), inline=True)
-    embed.add_field(name="Account Created", value=member.created_at.strftime("%d %b %Y %H:%M:%S"), inline=True)
-    embed.add_field(name="Server Name", value=guild.name, inline=True)
-    embed.add_field(name="Server ID", value=guild.id, inline=True)
-    embed.add_field(name="Total Members", value=guild.member_count, inline=True)
-    await interaction.response.send_message(embed=embed)
+    await interaction.response.send_message(embed=detailed_info_embed(member or interaction.user))
+
+
+# -------------------- PURGE --------------------
+active_purges = {}  # channel_id -> PurgeJob
+
+def parse_purge_args(ctx, text):
+    """Parse `.purge` arguments into (limit, channels, PurgeFilter, scan_limit).
+
+    Tokens: a number (max messages to delete), #channel (repeatable), @user /
+    user:<id>, bots, attachments, newer:<dur>, older:<dur>, scan:<n> and
+    regex:<pattern> (takes the rest of the line). With several channels the
+    amount is a total, taken from the channels in the order they're listed.
+    Returns an error string instead when something doesn't parse.
+    """
+    text, _, pattern = text.partition("regex:")
+    limit, scan_limit, channels, authors = None, None, [], []
+    options = {"bots_only": False, "attachments_only": False, "newer_than": None, "older_than": None}
+    for token in text.split():
+        key, _, value = token.lower().partition(":")
+        channel = re.fullmatch(r"<#(\d+)>", token)
+        user = re.fullmatch(r"<@!?(\d+)>|user:(\d+)", token)
+        if token.isdigit() and len(token) >= 15:
+            return f"❌ `{token}` looks like an ID; use `user:{token}` or a mention."
+        elif token.isdigit():
+            limit = int(token)
+            if limit > PURGE_MAX_SCAN:
+                return f"❌ Can purge at most {PURGE_MAX_SCAN} messages at once."
+        elif channel:
+            found = ctx.guild.get_channel(int(channel.group(1)))
+            if found is None or not hasattr(found, "history"):
+                return f"❌ Can't purge {token}."
+            channels.append(found)
+        elif user:
+            authors.append(int(next(g for g in user.groups() if g)))
+        elif token.lower() in ("bots", "bot"):
+            options["bots_only"] = True
+        elif token.lower() in ("attachments", "files"):
+            options["attachments_only"] = True
+        elif key in ("newer", "older") and parse_time(value):
+            options[f"{key}_than"] = parse_time(value)
+        elif key == "scan" and value.isdigit():
+            scan_limit = int(value)
+        else:
+            return f"❌ Don't understand `{token}`."
 
+    compiled = None
+    if pattern.strip():
+        try:
+            compiled = re.compile(pattern.strip(), re.IGNORECASE)
+        except re.error as e:
+            return f"❌ Bad regex: {e}"
+
+    purge_filter = PurgeFilter(authors=authors, pattern=compiled, **options)
+    filtered = purge_filter.describe() != "all messages"
+    if limit is None and not filtered:
+        return (
+            "❌ Usage: `.purge <amount> [@user] [#channel ...] [bots] [attachments] [newer:1d] [older:1d] [regex:<pattern>]`\n"
+            "With several channels, <amount> is a total taken from the channels in the order listed."
+        )
+    if scan_limit is None:
+        # Unfiltered purges read exactly what they delete; filtered ones may need to look further back
+        scan_limit = PURGE_MAX_SCAN if filtered else limit
+    return limit, channels or [ctx.channel], purge_filter, scan_limit
+
+class PurgeCancelView(View):
+    def __init__(self, job, owner_id):
+        super().__init__(timeout=None)
+        self.job = job
+        self.owner_id = owner_id
+
+    @discord.ui.button(label="Cancel", emoji="🛑", style=discord.ButtonStyle.red)
+    async def cancel_purge(self, interaction: discord.Interaction, button: Button):
+        if interaction.user.id != self.owner_id and interaction.user.id not in STAFF_IDS:
+            return await interaction.response.send_message("❌ Only staff can cancel a purge.", ephemeral=True)
+        self.job.cancel()
+        button.disabled = True
+        await interaction.response.edit_message(content=self.job.progress_text(), view=self)
 
 @bot.command(name="purge")
-async def purge_prefix(ctx, amount: int):
+async def purge_prefix(ctx, *, args: str = ""):
     # Check if user is staff
     if ctx.author.id not in STAFF_IDS:
         return await ctx.send("❌ You are not allowed to use this command.", delete_after=5)
 
+    parsed = parse_purge_args(ctx, args)
+    if isinstance(parsed, str):
+        return await ctx.send(parsed, delete_after=10)
+    limit, channels, purge_filter, scan_limit = parsed
+
     # Validate amount
-    if amount <= 0:
+    if limit is not None and limit <= 0:
         return await ctx.send("❌ Please provide a number greater than 0.", delete_after=5)
+    busy = [channel.mention for channel in channels if channel.id in active_purges]
+    if busy:
+        return await ctx.send(f"❌ Already purging {', '.join(busy)}.", delete_after=5)
 
     # Delete the command message first
     try:
@@ -367,10 +1002,198 @@ async def purge_prefix(ctx, amount: int):
     except:
         pass
 
-    # Purge messages
-    deleted = await ctx.channel.purge(limit=amount)
-    confirmation = await ctx.send(f"✅ Deleted {len(deleted)} messages.")
-    await confirmation.delete(delay=5)  # auto-delete confirmation
+    job = PurgeJob(channels, purge_filter, limit=limit, scan_limit=scan_limit, concurrency=PURGE_CONCURRENCY)
+    view = PurgeCancelView(job, ctx.author.id)
+    status = await ctx.send(job.progress_text(), view=view)
+    job.protected.add(status.id)
+    job.start_before = status
+    for channel in channels:
+        active_purges[channel.id] = job
+
+    task = asyncio.create_task(job.run())
+    try:
+        # Progress edits are periodic, not per delete, so a 50k purge costs a handful of edits
+        while not task.done():
+            await asyncio.wait({task}, timeout=PURGE_PROGRESS_SECONDS)
+            if not task.done():
+                try:
+                    await status.edit(content=job.progress_text())
+                except discord.HTTPException:
+                    pass
+        task.result()
+    except Exception as e:
+        print(f"Purge failed: {e}")
+    finally:
+        for channel in channels:
+            active_purges.pop(channel.id, None)
+        view.stop()
+
+    try:
+        await status.edit(content=job.progress_text(), view=None)
+        await status.delete(delay=15)  # auto-delete the summary
+    except discord.HTTPException:
+        pass
+
+
+# -------------------- DM QUEUE --------------------
+def is_transient_dm_error(exc):
+    if isinstance(exc, discord.Forbidden):
+        return False  # DMs closed or no shared server; retrying won't help
+    if isinstance(exc, discord.HTTPException):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+dm_queue = DMQueue(
+    os.path.join(DATA_DIR, "dm.db"),
+    is_transient_dm_error,
+    workers=DM_WORKERS,
+    rate_per_second=DM_RATE_PER_SECOND,
+)
+
+shutdown_hooks.append(dm_queue.close)
+
+@bot.tree.command(name="dm_failures", description="List DMs that could not be delivered")
+@app_commands.describe(kind="receipt, moderation or welcome (default: receipt)")
+async def dm_failures(interaction: discord.Interaction, kind: str = "receipt"):
+    if interaction.user.id not in STAFF_IDS:
+        return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
+
+    rows = await asyncio.to_thread(dm_queue.failures, kind.lower(), 15)
+    stats = dm_queue.stats()
+    header = (
+        f"📬 **DM queue** — pending {stats['pending']}, delivered {stats['delivered']}, "
+        f"failed {stats['failed']}, retried {stats['retried']}\n"
+    )
+    if not rows:
+        return await interaction.response.send_message(header + f"No undelivered `{kind}` DMs.", ephemeral=True)
+
+    lines = []
+    for _, user_id, ref, status, attempts, error, finished_at in rows:
+        ref_text = f" `#{ref}`" if ref else ""
+        lines.append(
+            f"<@{user_id}>{ref_text} — {status} after {attempts} attempt(s) <t:{int(finished_at)}:R>\n"
+            f"   {(error or '')[:120]}"
+        )
+    await interaction.response.send_message(header + "\n".join(lines)[:1900], ephemeral=True)
+
+
+# -------------------- RECEIPTS --------------------
+receipt_ledger = ReceiptLedger(os.path.join(DATA_DIR, "receipts.db"))
+
+async def close_receipt_ledger():
+    receipt_ledger.close()
+
+shutdown_hooks.append(close_receipt_ledger)
+
+def receipt_time(receipt):
+    return datetime.fromtimestamp(receipt["created_at"], tz=pytz.utc).astimezone(local_tz).strftime("%d %b %Y %H:%M:%S")
+
+def receipt_text(receipt):
+    return (
+        f"--- PURCHASE RECEIPT ---\n\n"
+        f"Member: {receipt['buyer_name']}\n"
+        f"Item: {receipt['item']}\n"
+        f"Price: {receipt['price']}\n"
+        f"Receipt ID: {receipt['id']}\n"
+        f"Issued by: {receipt['staff_name']}\n"
+        f"Time: {receipt_time(receipt)}\n"
+        f"------------------------"
+    )
+
+def receipt_embed(receipt, title="🛒 Purchase Logged"):
+    embed = discord.Embed(
+        title=title,
+        color=discord.Color.gold(),
+        timestamp=datetime.fromtimestamp(receipt["created_at"], tz=pytz.utc)
+    )
+    embed.add_field(name="Buyer", value=f"<@{receipt['buyer_id']}>", inline=True)
+    embed.add_field(name="Item", value=receipt["item"], inline=True)
+    embed.add_field(name="Price", value=receipt["price"], inline=True)
+    embed.add_field(name="Receipt ID", value=receipt["id"], inline=True)
+    embed.add_field(name="Issued by", value=f"<@{receipt['staff_id']}>", inline=True)
+    embed.add_field(name="Time", value=receipt_time(receipt), inline=True)
+    embed.set_footer(text="Store Bot")
+    return embed
+
+def queue_receipt_dm(member, receipt):
+    # A File is single-use, so each delivery attempt builds a new one
+    text = receipt_text(receipt)
+    return dm_queue.submit(
+        "receipt",
+        member.id,
+        lambda: member.send(
+            content="🧾 Here is your purchase receipt:",
+            file=discord.File(io.StringIO(text), filename=f"receipt_{receipt['id']}.txt"),
+        ),
+        priority=PRIORITY_RECEIPT,
+        ref=str(receipt["id"]),
+    )
+
+def issue_receipt(guild_id, member, item, price, staff):
+    return receipt_ledger.issue(
+        guild_id,
+        member.id,
+        f"{member.name}#{member.discriminator}",
+        item,
+        price,
+        staff.id,
+        f"{staff.name}#{staff.discriminator}",
+    )
+
+@bot.tree.command(name="receipt", description="Look up a purchase receipt by ID")
+@app_commands.describe(receipt_id="Receipt ID")
+async def receipt_slash(interaction: discord.Interaction, receipt_id: int):
+    receipt = await asyncio.to_thread(receipt_ledger.get, receipt_id)
+    # Buyers may look up their own receipts; everything else is staff only
+    if receipt is None or (interaction.user.id not in STAFF_IDS and receipt["buyer_id"] != interaction.user.id):
+        return await interaction.response.send_message(f"❌ Receipt `{receipt_id}` not found.", ephemeral=True)
+    await interaction.response.send_message(embed=receipt_embed(receipt, title="🧾 Receipt"), ephemeral=True)
+
+@bot.tree.command(name="receipts_export", description="Export receipts as a CSV file")
+@app_commands.describe(
+    since="Only receipts from this far back, e.g. 30d (default: all)",
+    buyer="Only this buyer's receipts",
+    staff="Only receipts issued by this staff member",
+    compress="Gzip the file (for very large exports)"
+)
+async def receipts_export_slash(
+    interaction: discord.Interaction, since: str = None, buyer: discord.User = None,
+    staff: discord.User = None, compress: bool = False
+):
+    if interaction.user.id not in STAFF_IDS:
+        return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
+    since_seconds = parse_time(since) if since else None
+    if since and not since_seconds:
+        return await interaction.response.send_message("❌ `since` must look like 12h, 30d or 6mo.", ephemeral=True)
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    filename = f"receipts_{datetime.now(local_tz).strftime('%Y%m%d_%H%M%S')}.csv" + (".gz" if compress else "")
+    path = os.path.join(DATA_DIR, f"export_{interaction.id}_{filename}")
+    try:
+        # Rows are streamed from SQLite into the file on a worker thread, never held in memory
+        count = await asyncio.to_thread(
+            receipt_ledger.export_csv,
+            path,
+            since=time.time() - since_seconds if since_seconds else None,
+            buyer_id=buyer.id if buyer else None,
+            staff_id=staff.id if staff else None,
+            compress=compress,
+        )
+        limit = interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024
+        if os.path.getsize(path) > limit:
+            return await interaction.followup.send(
+                f"❌ Export is {format_bytes(os.path.getsize(path))}, over the {format_bytes(limit)} upload limit. "
+                f"Try `compress` or a shorter `since`.",
+                ephemeral=True
+            )
+        await interaction.followup.send(
+            f"📤 {count} receipt(s) exported.", file=discord.File(path, filename=filename), ephemeral=True
+        )
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
 @bot.tree.command(
@@ -387,69 +1210,321 @@ async def give_receipt_slash(interaction: discord.Interaction, member: discord.M
     if interaction.user.id not in STAFF_IDS:
         return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
 
-    # Generate receipt
-    receipt_id = random.randint(1000, 9999)
-    time_now = datetime.utcnow().astimezone(local_tz).strftime("%d %b %Y %H:%M:%S")
-    receipt_text = (
-        f"--- PURCHASE RECEIPT ---\n\n"
-        f"Member: {member.name}#{member.discriminator}\n"
-        f"Item: {item}\n"
-        f"Price: {price}\n"
-        f"Receipt ID: {receipt_id}\n"
-        f"Issued by: {interaction.user.name}#{interaction.user.discriminator}\n"
-        f"Time: {time_now}\n"
-        f"------------------------"
-    )
-    file = discord.File(io.StringIO(receipt_text), filename=f"receipt_{receipt_id}.txt")
+    # Record in the ledger first; its ID is the receipt number
+    receipt = await asyncio.to_thread(issue_receipt, interaction.guild_id, member, item, price, interaction.user)
 
-    # Send receipt to buyer DM
-    try:
-        await member.send(content="🧾 Here is your purchase receipt:", file=file)
-        dm_status = "✅ Receipt sent to buyer DMs."
-    except Exception:
-        dm_status = "❌ Could not send receipt DM (buyer may have DMs disabled)."
+    # Queue receipt for the buyer's DMs
+    queue_receipt_dm(member, receipt)
+    dm_status = "📬 Receipt DM queued (see `/dm_failures` if it never arrives)."
 
     # Log in staff channel
     guild = bot.get_guild(GUILD_ID)
     log_channel = guild.get_channel(SCRIPT_LOG_ID_CHANNEL)
     if log_channel:
-        embed = discord.Embed(
-            title="🛒 Purchase Logged",
-            color=discord.Color.gold(),
-            timestamp=datetime.utcnow()
-        )
-        embed.add_field(name="Buyer", value=member.mention, inline=True)
-        embed.add_field(name="Item", value=item, inline=True)
-        embed.add_field(name="Price", value=price, inline=True)
-        embed.add_field(name="Receipt ID", value=receipt_id, inline=True)
-        embed.add_field(name="Issued by", value=interaction.user.mention, inline=True)
-        embed.add_field(name="Time", value=time_now, inline=True)
-        embed.set_footer(text="Store Bot")
-        await log_channel.send(embed=embed)
+        await log_channel.send(embed=receipt_embed(receipt))
 
     # Confirm in command (ephemeral)
-    await interaction.response.send_message(f"Receipt created for {member.mention}. {dm_status}", ephemeral=True)
+    await interaction.response.send_message(
+        f"Receipt `{receipt['id']}` created for {member.mention}. {dm_status}", ephemeral=True
+    )
+
+
+# -------------------- BULK RECEIPTS --------------------
+BULK_RECEIPT_CONCURRENCY = int(os.getenv("BULK_RECEIPT_CONCURRENCY", 8))
+BULK_RECEIPT_MAX_ROWS = int(os.getenv("BULK_RECEIPT_MAX_ROWS", 2000))
+BULK_RECEIPT_MAX_BYTES = 2 * 1024 * 1024
+BULK_RECEIPT_DM_WAIT = float(os.getenv("BULK_RECEIPT_DM_WAIT", 120))  # seconds to wait for DM outcomes in the report
+# Uncached usernames cost one gateway member query each, and the gateway allows ~110 per minute
+BULK_RECEIPT_MAX_NAME_LOOKUPS = int(os.getenv("BULK_RECEIPT_MAX_NAME_LOOKUPS", 100))
+BULK_RECEIPT_NAME_MATCHES = 10  # query_members is a prefix search; fetch a few and match exactly
+
+def read_receipt_rows(data):
+    """Yield (line_no, member, item, price) from CSV bytes, one row at a time.
+
+    A header row (first cell "member") is skipped; blank lines are ignored.
+    Rows with the wrong number of cells come through with None fields so
+    validation can report them.
+    """
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if reader.line_num == 1 and cells[0].lower() in ("member", "buyer", "user"):
+            continue
+        if len(cells) != 3:
+            yield reader.line_num, None, None, None
+            continue
+        yield reader.line_num, *cells
+
+def bulk_member_id(text):
+    found = re.fullmatch(r"<@!?(\d+)>|(\d{15,20})", text)
+    return int(next(g for g in found.groups() if g)) if found else None
+
+def uncached_bulk_names(guild, rows):
+    """Distinct usernames (lowercased) in the rows that would need a gateway query."""
+    return {
+        member_text.lower() for _, member_text, _, _ in rows
+        if member_text and bulk_member_id(member_text) is None and guild.get_member_named(member_text) is None
+    }
+
+async def query_member_named(guild, name):
+    matches = await guild.query_members(name, limit=BULK_RECEIPT_NAME_MATCHES)
+    name = name.lower()
+    for member in matches:
+        if member.name.lower() == name:
+            return member
+    for member in matches:
+        if member.nick and member.nick.lower() == name:
+            return member
+    return None
+
+async def resolve_bulk_member(guild, text, name_lookups):
+    """`name_lookups` maps lowercased usernames to shared query tasks, so a repeated name is queried once."""
+    member_id = bulk_member_id(text)
+    if member_id is not None:
+        return await resolve_member(guild, member_id)
+    member = guild.get_member_named(text)
+    if member is None:
+        lookup = name_lookups.get(text.lower())
+        if lookup is None:
+            lookup = name_lookups[text.lower()] = asyncio.ensure_future(query_member_named(guild, text))
+        member = await lookup
+    return member
+
+async def validate_receipt_rows(guild, rows):
+    """Resolve every row's member concurrently; returns (valid, invalid) lists of report dicts."""
+    semaphore = asyncio.Semaphore(BULK_RECEIPT_CONCURRENCY)
+    name_lookups = {}
+
+    async def check(line_no, member_text, item, price):
+        entry = {"line": line_no, "member": member_text or "", "item": item or "", "price": price or ""}
+        if member_text is None:
+            entry["error"] = "expected 3 columns: member,item,price"
+        elif not item or not price:
+            entry["error"] = "item and price are required"
+        elif len(item) > 256 or len(price) > 64:
+            entry["error"] = "item or price too long"
+        else:
+            async with semaphore:
+                try:
+                    entry["member_obj"] = await resolve_bulk_member(guild, member_text, name_lookups)
+                except discord.HTTPException as e:
+                    entry["error"] = f"member lookup failed: {e}"
+                    return entry
+            if entry["member_obj"] is None:
+                entry["error"] = "member not found"
+        return entry
+
+    entries = await asyncio.gather(*(check(*row) for row in rows))
+    valid = [entry for entry in entries if "error" not in entry]
+    invalid = [entry for entry in entries if "error" in entry]
+    return valid, invalid
+
+def bulk_receipt_report(entries):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("line", "member", "item", "price", "status", "receipt_id", "detail"))
+    for entry in sorted(entries, key=lambda entry: entry["line"]):
+        writer.writerow((
+            entry["line"], entry["member"], entry["item"], entry["price"],
+            entry.get("status", "invalid"), entry.get("receipt_id", ""), entry.get("error", entry.get("detail", "")),
+        ))
+    return discord.File(io.BytesIO(buffer.getvalue().encode()), filename="receipt_report.csv")
+
+@bot.tree.command(name="give_receipts_bulk", description="Issue receipts from a CSV of member,item,price rows")
+@app_commands.describe(
+    file="CSV with member (ID, mention or username), item and price columns",
+    skip_invalid="Issue the valid rows even if some rows are invalid"
+)
+async def give_receipts_bulk(interaction: discord.Interaction, file: discord.Attachment, skip_invalid: bool = False):
+    if interaction.user.id not in STAFF_IDS:
+        return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
+    if interaction.guild is None:
+        return await interaction.response.send_message("❌ Use this command in a server.", ephemeral=True)
+    if file.size > BULK_RECEIPT_MAX_BYTES:
+        return await interaction.response.send_message(
+            f"❌ File is over {format_bytes(BULK_RECEIPT_MAX_BYTES)}.", ephemeral=True
+        )
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    rows = []
+    try:
+        for row in read_receipt_rows(await file.read()):
+            rows.append(row)
+            if len(rows) > BULK_RECEIPT_MAX_ROWS:
+                return await interaction.followup.send(f"❌ More than {BULK_RECEIPT_MAX_ROWS} rows.", ephemeral=True)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return await interaction.followup.send(f"❌ Couldn't read the CSV: {e}", ephemeral=True)
+    if not rows:
+        return await interaction.followup.send("❌ The CSV has no rows.", ephemeral=True)
+    # Keep gateway lookups inside the rate limit so validation finishes well before the interaction expires
+    names = uncached_bulk_names(interaction.guild, rows)
+    if len(names) > BULK_RECEIPT_MAX_NAME_LOOKUPS:
+        return await interaction.followup.send(
+            f"❌ {len(names)} usernames need a lookup (max {BULK_RECEIPT_MAX_NAME_LOOKUPS}); "
+            f"use member IDs or mentions for the rest.",
+            ephemeral=True
+        )
+
+    # ---- Validate everything before issuing anything ----
+    valid, invalid = await validate_receipt_rows(interaction.guild, rows)
+    if invalid and not skip_invalid:
+        return await interaction.followup.send(
+            f"❌ {len(invalid)} of {len(rows)} row(s) are invalid; nothing was issued. "
+            f"Fix them or rerun with `skip_invalid`.",
+            file=bulk_receipt_report(invalid),
+            ephemeral=True
+        )
+
+    # ---- Issue concurrently; log embeds go out 10 per message via the batcher ----
+    semaphore = asyncio.Semaphore(BULK_RECEIPT_CONCURRENCY)
+    guild = bot.get_guild(GUILD_ID)
+    log_channel = guild.get_channel(SCRIPT_LOG_ID_CHANNEL) if guild else None
+    deliveries = {}  # DM future -> entry
+
+    async def issue(entry):
+        member = entry.pop("member_obj")
+        async with semaphore:
+            try:
+                receipt = await asyncio.to_thread(
+                    issue_receipt, interaction.guild_id, member, entry["item"], entry["price"], interaction.user
+                )
+            except Exception as e:
+                entry.update(status="failed", detail=f"ledger write failed: {e}")
+                return
+        entry.update(status="issued", receipt_id=receipt["id"], detail="DM queued")
+        deliveries[queue_receipt_dm(member, receipt)] = entry
+        if log_channel:
+            log_batcher.add(log_channel.id, receipt_embed(receipt))
+
+    await asyncio.gather(*(issue(entry) for entry in valid))
+
+    # Report DM outcomes that land within the wait; the rest stay "DM queued" (see /dm_failures)
+    if deliveries:
+        done, _ = await asyncio.wait(deliveries, timeout=BULK_RECEIPT_DM_WAIT)
+        for future in done:
+            deliveries[future]["detail"] = "DM delivered" if future.result() else "DM failed"
+
+    issued = sum(1 for entry in valid if entry.get("status") == "issued")
+    await interaction.followup.send(
+        f"🧾 Issued **{issued}** of {len(rows)} receipt(s)"
+        + (f", skipped {len(invalid)} invalid row(s)" if invalid else "") + ".",
+        file=bulk_receipt_report(valid + invalid),
+        ephemeral=True
+    )
 
 
+# -------------------- WELCOME --------------------
+WELCOME_CHANNEL_ID = 1443404889894948974  # your welcome channel ID
+PING_CHANNEL_IDS = [
+1443409906458951784,
+1443409287102599290,
+1443410881743552533,
+1443411776610898112,
+1443436150655287376,
+1449400155273957377,
+]
+
+DELETE_AFTER = 2  # seconds
+GIF_URL = "https://cdn.discordapp.com/attachments/1443571210452467782/1444395990239936676/welcome.gif?ex=692c8e17&is=692b3c97&hm=540497f44cec782c13d1881dc85bd54f86cfa34a66892525983b7c6e8b8f3330"
+
+JOIN_BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", 3))  # seconds of joins sharing one ping
+RAID_WINDOW = int(os.getenv("RAID_WINDOW", 30))  # seconds
+RAID_JOIN_THRESHOLD = int(os.getenv("RAID_JOIN_THRESHOLD", 10))  # joins per RAID_WINDOW before degrading
+JOIN_LOG_SIZE = int(os.getenv("JOIN_LOG_SIZE", 5000))  # recent joins kept per guild for joined:<dur> selectors
+
+resolved_channels = {}  # channel_id -> channel, so pings never need fetch_channel after the first
+pending_joins = defaultdict(list)  # guild_id -> members waiting for the next ping batch
+raid_joins = defaultdict(list)  # guild_id -> members whose full welcome was skipped during a raid
+recent_joins = defaultdict(deque)  # guild_id -> join timestamps within RAID_WINDOW
+raid_mode = set()  # guild_ids currently degraded
+join_log = defaultdict(lambda: deque(maxlen=JOIN_LOG_SIZE))  # guild_id -> (wall time, user_id) of recent joins
+
+async def resolve_channel(channel_id):
+    channel = resolved_channels.get(channel_id) or bot.get_channel(channel_id)
+    if channel is None:
+        channel = await bot.fetch_channel(channel_id)
+    resolved_channels[channel_id] = channel
+    return channel
+
 @bot.event
-async def on_member_join(member):
+async def on_guild_channel_delete(channel):
+    resolved_channels.pop(channel.id, None)
+    guild_snapshots.adjust(channel.guild.id, channels=-1)
+
+def note_join(guild_id):
+    """Record a join and return True while the guild is above the raid threshold."""
+    now = time.monotonic()
+    joins = recent_joins[guild_id]
+    joins.append(now)
+    while joins and joins[0] < now - RAID_WINDOW:
+        joins.popleft()
+    raiding = len(joins) > RAID_JOIN_THRESHOLD
+    if raiding and guild_id not in raid_mode:
+        raid_mode.add(guild_id)
+        print(f"Join raid in {guild_id}: {len(joins)} joins in {RAID_WINDOW}s, welcome DMs and GIFs paused.")
+    elif not raiding and guild_id in raid_mode:
+        raid_mode.discard(guild_id)
+        print(f"Join rate back to normal in {guild_id}.")
+    return raiding
+
+def mention_chunks(members, limit=2000):
+    chunk = ""
+    for member in members:
+        if chunk and len(chunk) + len(member.mention) + 1 > limit:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk} {member.mention}" if chunk else member.mention
+    if chunk:
+        yield chunk
+
+async def ping_members(channel_id, members):
     try:
-        # ---- CONFIG ----
-        WELCOME_CHANNEL_ID = 1443404889894948974  # your welcome channel ID
-        PING_CHANNEL_IDS = [
-        1443409906458951784,
-        1443409287102599290,
-        1443410881743552533,
-        1443411776610898112,
-        1443436150655287376,
-        1449400155273957377,
-        ]
-
-        DELETE_AFTER = 2  # seconds
-        GIF_URL = "https://cdn.discordapp.com/attachments/1443571210452467782/1444395990239936676/welcome.gif?ex=692c8e17&is=692b3c97&hm=540497f44cec782c13d1881dc85bd54f86cfa34a66892525983b7c6e8b8f3330"
+        channel = await resolve_channel(channel_id)
+        for chunk in mention_chunks(members):
+            msg = await channel.send(chunk, allowed_mentions=discord.AllowedMentions(users=True))
+            spawn(delete_later(msg, DELETE_AFTER))
+    except Exception as e:
+        print("JOIN PING FAILED:", channel_id, e)
+
+async def flush_join_batch(guild_id):
+    await asyncio.sleep(JOIN_BATCH_WINDOW)
+    members = pending_joins.pop(guild_id, [])
+    unwelcomed = raid_joins.pop(guild_id, [])
+    if not members:
+        return
+
+    if unwelcomed:
+        # Degraded: one plain welcome for the raid batch instead of one GIF post per member
+        try:
+            channel = await resolve_channel(WELCOME_CHANNEL_ID)
+            for chunk in mention_chunks(unwelcomed, limit=1900):
+                await channel.send(f"👑 **Welcome to Royal Store,** {chunk}!")
+        except Exception as e:
+            print(f"Welcome Error: {e}")
 
+    # One ping per channel for everyone who joined in the window
+    await asyncio.gather(*(ping_members(channel_id, members) for channel_id in PING_CHANNEL_IDS))
+
+@bot.event
+async def on_member_join(member):
+    role_index.add_member(member.guild.id, member.id, [r.id for r in member.roles])
+    adjust_member_count(member.guild.id, 1)
+
+    guild_id = member.guild.id
+    if not pending_joins[guild_id]:
+        spawn(flush_join_batch(guild_id))
+    pending_joins[guild_id].append(member)
+    join_log[guild_id].append((time.time(), member.id))
+
+    if note_join(guild_id):
+        raid_joins[guild_id].append(member)
+        return  # raid: the batch flush sends a single plain welcome, no DMs or GIFs
+
+    try:
         # ---- MEMBER COUNT ----
-        member_count = len(member.guild.members)
+        member_count = member.guild.member_count
 
         # ---- BIG WELCOME MSG (Server) ----
         msg = (
@@ -474,9 +1549,8 @@ async def on_member_join(member):
         embed.set_image(url=GIF_URL)
 
         # ---- SEND TO SERVER ----
-        channel = member.guild.get_channel(WELCOME_CHANNEL_ID)
-        if channel:
-            await channel.send(content=msg, embed=embed)
+        channel = await resolve_channel(WELCOME_CHANNEL_ID)
+        await channel.send(content=msg, embed=embed)
 
         # ---- DM MESSAGE ----
         dm_msg = (
@@ -497,22 +1571,13 @@ async def on_member_join(member):
         dm_embed = discord.Embed(color=discord.Color.gold())
         dm_embed.set_image(url=GIF_URL)
 
-        try:
-            await member.send(content=dm_msg, embed=dm_embed)
-        except:
-            pass  # user has DMs closed
+        dm_queue.submit(
+            "welcome", member.id, lambda: member.send(content=dm_msg, embed=dm_embed), priority=PRIORITY_WELCOME
+        )
 
     except Exception as e:
         print(f"Welcome Error: {e}")
 
-    for channel_id in PING_CHANNEL_IDS:
-        try:
-            channel = await bot.fetch_channel(channel_id)
-            msg = await channel.send(member.mention)
-            asyncio.create_task(delete_later(msg, DELETE_AFTER))
-        except Exception as e:
-            print("JOIN PING FAILED:", channel_id, e)
-
 
 async def delete_later(message, delay):
     await asyncio.sleep(delay)
@@ -521,8 +1586,104 @@ async def delete_later(message, delay):
     except:
         pass
 
-# -------------------- In-memory giveaways --------------------
+# -------------------- Giveaway storage --------------------
 active_giveaways = {}  # giveaway_id -> giveaway info
+ended_giveaways = OrderedDict()  # recently ended, kept for rerolls (oldest first)
+MAX_ENDED_GIVEAWAYS = 20
+
+# Every start/join/draw/end is appended here; replayed on startup by restore_giveaways()
+giveaway_journal = GiveawayJournal(os.path.join(DATA_DIR, "giveaways.journal"), keep_ended=MAX_ENDED_GIVEAWAYS)
+pending_giveaways, pending_ended = giveaway_journal.replay()
+
+GIVEAWAY_RECORD_KEYS = (
+    "id", "guild_id", "channel_id", "message_id", "host_id",
+    "prize", "winners", "end_time", "requirements", "rules", "role_weights",
+)
+
+def giveaway_record(giveaway):
+    return {key: giveaway.get(key) for key in GIVEAWAY_RECORD_KEYS}
+
+def journal_snapshot(giveaways):
+    return {
+        giveaway_id: (
+            giveaway_record(giveaway), giveaway["participants"], len(giveaway["participants"]),
+            set(giveaway.get("drawn", ())),
+        )
+        for giveaway_id, giveaway in giveaways.items()
+    }
+
+def remember_ended(giveaway):
+    # Built once at close; rerolls reuse it and just exclude earlier picks
+    if giveaway["participants"].weighted:
+        giveaway["alias_table"] = AliasTable(giveaway["participants"])
+    giveaway.setdefault("drawn", set())
+    ended_giveaways[giveaway["id"]] = giveaway
+    while len(ended_giveaways) > MAX_ENDED_GIVEAWAYS:
+        ended_giveaways.popitem(last=False)
+
+def end_giveaway(giveaway_id):
+    giveaway = active_giveaways.pop(giveaway_id, None)
+    giveaway_scheduler.cancel(giveaway_id)
+    if giveaway:
+        giveaway_journal.end(giveaway_id)
+        giveaway["view"].stop()  # drop the persistent view from the bot's view store
+        remember_ended(giveaway)
+    return giveaway
+
+def register_giveaway_views():
+    """Re-attach join buttons from setup_hook, so clicks work while READY is still chunking.
+
+    Needs no channel cache; restore_giveaways() swaps in the real channel once it's ready.
+    """
+    for giveaway_id, record in pending_giveaways.items():
+        view = GiveawayView(giveaway_id)
+        bot.add_view(view, message_id=record["message_id"])
+        channel = bot.get_partial_messageable(record["channel_id"], guild_id=record["guild_id"])
+        active_giveaways[giveaway_id] = {
+            **record,
+            "channel": channel,
+            "message": channel.get_partial_message(record["message_id"]),
+            "view": view,
+        }
+
+def restore_giveaways():
+    for giveaway_id in pending_giveaways:
+        giveaway = active_giveaways[giveaway_id]
+        channel = bot.get_channel(giveaway["channel_id"])
+        if channel is None:
+            print(f"Giveaway {giveaway_id}: channel {giveaway['channel_id']} is gone, dropping it.")
+            del active_giveaways[giveaway_id]
+            giveaway["view"].stop()
+            giveaway_journal.end(giveaway_id)
+            continue
+        giveaway["channel"] = channel
+        giveaway["message"] = channel.get_partial_message(giveaway["message_id"])
+        giveaway_scheduler.schedule(giveaway_id, time.time())
+    for record in pending_ended.values():
+        channel = bot.get_channel(record["channel_id"])
+        if channel is None:
+            continue  # not rerollable; the next compaction drops it
+        remember_ended({**record, "channel": channel, "message": channel.get_partial_message(record["message_id"])})
+    print(
+        f"Restored {len(active_giveaways)} giveaway(s) and {len(ended_giveaways)} ended giveaway(s) from the journal."
+    )
+    pending_giveaways.clear()
+    pending_ended.clear()
+
+@tasks.loop(seconds=GIVEAWAY_SYNC_SECONDS)
+async def giveaway_journal_maintenance():
+    if giveaway_journal.needs_compaction({**active_giveaways, **ended_giveaways}):
+        # Snapshot on the loop (no await in between), rewrite off it
+        offset = giveaway_journal.position()
+        live, ended = journal_snapshot(active_giveaways), journal_snapshot(ended_giveaways)
+        await asyncio.to_thread(giveaway_journal.compact, live, offset, ended)
+    await asyncio.to_thread(giveaway_journal.sync)
+
+async def close_giveaway_journal():
+    giveaway_journal_maintenance.cancel()
+    await asyncio.to_thread(giveaway_journal.close)
+
+shutdown_hooks.append(close_giveaway_journal)
 
 # -------------------- Time parser --------------------
 def parse_time(time_str: str):
@@ -552,26 +1713,156 @@ def format_time(seconds):
     parts.append(f"{secs}s")
     return " ".join(parts)
 
+# -------------------- Requirements --------------------
+def parse_requirements(text):
+    """Split requirements into enforced rules and leftover free text.
+
+    Enforced tokens: @Role / role ID / role:<id>, age:<duration> (account age)
+    and joined:<duration> (time in the server). Returns None on a bad duration.
+    """
+    rules = {"roles": [], "account_age": 0, "member_age": 0, "note": ""}
+    notes = []
+    for token in text.replace(",", " ").split():
+        role = re.fullmatch(r"<@&(\d+)>|role:(\d+)|(\d{17,20})", token)
+        key, _, value = token.lower().partition(":")
+        if role:
+            rules["roles"].append(int(next(g for g in role.groups() if g)))
+        elif key in ("age", "joined") and value:
+            seconds = parse_time(value)
+            if seconds is None:
+                return None
+            rules["account_age" if key == "age" else "member_age"] = seconds
+        else:
+            notes.append(token)
+    rules["note"] = " ".join(notes)
+    return rules
+
+def format_requirements(rules):
+    lines = []
+    if rules["roles"]:
+        lines.append("Role: " + ", ".join(f"<@&{role_id}>" for role_id in rules["roles"]))
+    if rules["account_age"]:
+        lines.append(f"Account age: {format_time(rules['account_age'])}+")
+    if rules["member_age"]:
+        lines.append(f"In server: {format_time(rules['member_age'])}+")
+    if rules["note"]:
+        lines.append(rules["note"])
+    return "\n".join(lines)
+
+def unmet_requirement(giveaway, member):
+    """Reason the member can't join, or None. Only in-memory lookups - no REST calls."""
+    rules = giveaway.get("rules")
+    if not rules:
+        return None
+    now = discord.utils.utcnow()
+    if rules["account_age"] and (now - member.created_at).total_seconds() < rules["account_age"]:
+        return f"Your account must be at least **{format_time(rules['account_age'])}** old."
+    if rules["member_age"]:
+        joined_at = getattr(member, "joined_at", None)
+        if joined_at is None or (now - joined_at).total_seconds() < rules["member_age"]:
+            return f"You must have been in the server for at least **{format_time(rules['member_age'])}**."
+    if rules["roles"]:
+        have = held_roles(giveaway["guild_id"], member, rules["roles"])
+        missing = [role_id for role_id in rules["roles"] if role_id not in have]
+        if missing:
+            return "You need: " + ", ".join(f"<@&{role_id}>" for role_id in missing)
+    return None
+
+# -------------------- Bonus entries --------------------
+MAX_ENTRY_WEIGHT = 100
+
+def parse_role_weights(text):
+    """Parse "@Booster=3 @Customer=2" (or raw role IDs) into [[role_id, weight], ...]."""
+    weights = []
+    for token in text.replace(",", " ").split():
+        match = re.fullmatch(r"(?:<@&)?(\d+)>?=(\d+)", token)
+        if not match:
+            return None
+        role_id, weight = int(match.group(1)), int(match.group(2))
+        if not 1 <= weight <= MAX_ENTRY_WEIGHT:
+            return None
+        weights.append([role_id, weight])
+    return weights or None
+
+def format_role_weights(role_weights):
+    return "\n".join(f"<@&{role_id}> ×{weight}" for role_id, weight in role_weights)
+
+def entry_weight(giveaway, member):
+    role_weights = giveaway.get("role_weights")
+    if not role_weights:
+        return 1
+    held = held_roles(giveaway["guild_id"], member, [role_id for role_id, _ in role_weights])
+    # Best matching role wins; bonuses don't stack
+    return max((weight for role_id, weight in role_weights if role_id in held), default=1)
+
+async def resolve_member(guild, user_id):
+    """Member from discord.py's cache, the active-member cache, or the API, in that order."""
+    member = guild.get_member(user_id) or active_members.get(guild.id, user_id)
+    if member:
+        return member
+    try:
+        member = await guild.fetch_member(user_id)
+        remember_member(member)
+        return member
+    except discord.NotFound:
+        return None  # left the server
+    except discord.HTTPException as e:
+        print(f"Could not fetch member {user_id}: {e}")
+        return None
+
+async def pick_winners(giveaway, count):
+    """Draw `count` members still in the server, never repeating an earlier pick."""
+    participants = giveaway["participants"]
+    drawn = giveaway.setdefault("drawn", set())
+    table = giveaway.get("alias_table")
+    guild = giveaway["channel"].guild
+    winners = []
+    while len(winners) < count:
+        if table:
+            batch = table.sample(count - len(winners), exclude=drawn)
+        else:
+            batch = participants.sample(count - len(winners), exclude=drawn)
+        if not batch:
+            break
+        giveaway_journal.drawn(giveaway["id"], batch)  # a reroll after a restart must not repeat these
+        for user_id in batch:
+            drawn.add(user_id)
+            member = await resolve_member(guild, user_id)
+            if member:
+                winners.append(member)
+    return winners
+
 # -------------------- Giveaway Buttons --------------------
 class GiveawayView(discord.ui.View):
     def __init__(self, giveaway_id):
         super().__init__(timeout=None)
         self.giveaway_id = giveaway_id
+        # Stable custom_id so the button keeps working after a restart
+        self.join.custom_id = f"giveaway:{giveaway_id}"
 
     @discord.ui.button(emoji="🎉", style=discord.ButtonStyle.green)
     async def join(self, interaction: discord.Interaction, button: discord.ui.Button):
         giveaway = active_giveaways.get(self.giveaway_id)
         if not giveaway:
             return await interaction.response.send_message("❌ Giveaway ended.", ephemeral=True)
-        if interaction.user.id in giveaway["participants"]:
+        unmet = unmet_requirement(giveaway, interaction.user)
+        if unmet:
+            return await interaction.response.send_message(f"🚫 {unmet}", ephemeral=True)
+        weight = entry_weight(giveaway, interaction.user)
+        # add() checks and inserts without yielding, so double-clicks can't both get in
+        if not giveaway["participants"].add(interaction.user.id, weight):
             return await interaction.response.send_message("⚠️ Already joined!", ephemeral=True)
-        giveaway["participants"].append(interaction.user.id)
-        await interaction.response.send_message(f"✅ You joined the giveaway!", ephemeral=True)
-        await update_embed(giveaway)
+        giveaway_journal.join(self.giveaway_id, interaction.user.id, weight)
+        if weight > 1:
+            await interaction.response.send_message(f"✅ You joined the giveaway with **{weight}** entries!", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"✅ You joined the giveaway!", ephemeral=True)
+        # Refresh the participant count soon; a burst of joins shares one edit
+        giveaway_scheduler.schedule_soon(self.giveaway_id, JOIN_REFRESH_DELAY)
 
 # -------------------- Helper Functions --------------------
 async def update_embed(giveaway, ended=False):
-    time_left = max(0, int(giveaway["end_time"] - asyncio.get_event_loop().time()))
+    time_left = max(0, int(giveaway["end_time"] - time.time()))
     
     title = f"🎁 {giveaway['prize']} 🎁"
     if ended:
@@ -582,14 +1873,19 @@ async def update_embed(giveaway, ended=False):
         color=discord.Color.green()
     )
     
-    embed.add_field(name="🎤 Hosted By", value=giveaway['host'].mention, inline=True)
+    embed.add_field(name="🎤 Hosted By", value=f"<@{giveaway['host_id']}>", inline=True)
     embed.add_field(name="🎯 Winners", value=str(giveaway['winners']), inline=True)
     embed.add_field(name="👥 Participants", value=str(len(giveaway['participants'])), inline=True)
     if not ended:
         embed.add_field(name="⏱ Time Left", value=format_time(time_left), inline=True)
     
-    if giveaway.get("requirements"):
+    if giveaway.get("rules"):
+        embed.add_field(name="✅ Requirements", value=format_requirements(giveaway["rules"]), inline=True)
+    elif giveaway.get("requirements"):
         embed.add_field(name="✅ Requirements", value=giveaway['requirements'], inline=True)
+
+    if giveaway.get("role_weights"):
+        embed.add_field(name="🎟 Bonus Entries", value=format_role_weights(giveaway["role_weights"]), inline=True)
     
     if not ended:
         embed.set_footer(text="🎉 Click the button to join!")
@@ -613,8 +1909,10 @@ async def announce_winner(giveaway, reroll=False):
     await update_embed(giveaway, ended=True)
     
     if participants:
-        winners_list = random.sample(participants, min(giveaway["winners"], len(participants)))
-        mentions = ", ".join([channel.guild.get_member(uid).mention for uid in winners_list])
+        winners_list = await pick_winners(giveaway, giveaway["winners"])
+        if not winners_list:
+            return await channel.send(f"😢 No eligible participants left for **{giveaway['prize']}**.")
+        mentions = ", ".join(member.mention for member in winners_list)
         if reroll:
             await channel.send(f"🔄 Giveaway reroll! New winner(s): {mentions} 🎉")
         else:
@@ -622,15 +1920,42 @@ async def announce_winner(giveaway, reroll=False):
     else:
         await channel.send(f"😢 No participants for **{giveaway['prize']}**.")
 
+# -------------------- Countdown Scheduler --------------------
+JOIN_REFRESH_DELAY = 3  # seconds
+
+@metrics.timed("scheduler_job_duration_seconds", job="giveaway")
+async def tick_giveaway(giveaway_id):
+    giveaway = active_giveaways.get(giveaway_id)
+    if not giveaway:
+        return None
+    now = time.time()
+    time_left = giveaway["end_time"] - now
+    if time_left <= 0:
+        end_giveaway(giveaway_id)
+        await announce_winner(giveaway)
+        return None
+    try:
+        await update_embed(giveaway)
+    except discord.NotFound:
+        end_giveaway(giveaway_id)  # giveaway message was deleted
+        return None
+    except discord.HTTPException as e:
+        print(f"Giveaway {giveaway_id} refresh failed: {e}")
+    return now + min(get_update_interval(int(time_left)), time_left)
+
+# One sleeping coroutine drives every giveaway; end times are wall-clock so they survive restarts
+giveaway_scheduler = DueScheduler(tick_giveaway, clock=time.time)
+
 # -------------------- Slash Commands --------------------
 @bot.tree.command(name="giveaway", description="Start a giveaway")
 @app_commands.describe(
     duration="Duration (e.g., 30s,5m,2h,1d,1w,1mo)",
     winners="Number of winners",
     prize="Prize name",
-    requirements="Optional requirements"
+    requirements="Optional, e.g. @Role age:30d joined:7d (account age / time in server)",
+    bonus_entries="Optional extra entries per role, e.g. @Booster=3 @Customer=2"
 )
-async def giveaway_cmd(interaction: discord.Interaction, duration: str, winners: int, prize: str, requirements: str = None):
+async def giveaway_cmd(interaction: discord.Interaction, duration: str, winners: int, prize: str, requirements: str = None, bonus_entries: str = None):
     if not interaction.user.guild_permissions.administrator:
         return await interaction.response.send_message("❌ Only staff can start giveaways.", ephemeral=True)
 
@@ -638,7 +1963,25 @@ async def giveaway_cmd(interaction: discord.Interaction, duration: str, winners:
     if seconds is None:
         return await interaction.response.send_message("❌ Invalid duration! Use s,m,h,d,w,mo", ephemeral=True)
 
+    rules = None
+    if requirements:
+        rules = parse_requirements(requirements)
+        if rules is None:
+            return await interaction.response.send_message(
+                "❌ Invalid requirements! Use `@Role age:30d joined:7d`.", ephemeral=True
+            )
+
+    role_weights = None
+    if bonus_entries:
+        role_weights = parse_role_weights(bonus_entries)
+        if role_weights is None:
+            return await interaction.response.send_message(
+                f"❌ Invalid bonus entries! Use `@Role=3 @OtherRole=2` (1-{MAX_ENTRY_WEIGHT} entries).", ephemeral=True
+            )
+
     giveaway_id = random.randint(100000, 999999)
+    while giveaway_id in active_giveaways:
+        giveaway_id = random.randint(100000, 999999)
     view = GiveawayView(giveaway_id)
 
     title = f"🎁 {prize} 🎁"
@@ -647,56 +1990,53 @@ async def giveaway_cmd(interaction: discord.Interaction, duration: str, winners:
     embed.add_field(name="🎯 Winners", value=str(winners), inline=True)
     embed.add_field(name="👥 Participants", value="0", inline=True)
     embed.add_field(name="⏱ Duration", value=duration, inline=True)
-    if requirements:
-        embed.add_field(name="✅ Requirements", value=requirements, inline=True)
+    if rules:
+        embed.add_field(name="✅ Requirements", value=format_requirements(rules), inline=True)
+    if role_weights:
+        embed.add_field(name="🎟 Bonus Entries", value=format_role_weights(role_weights), inline=True)
     embed.set_footer(text="🎉 Click the button to join!")
 
     msg = await interaction.channel.send(embed=embed, view=view)
 
     # Store giveaway
-    end_time = asyncio.get_event_loop().time() + seconds
-    active_giveaways[giveaway_id] = {
+    end_time = time.time() + seconds
+    giveaway = {
+        "id": giveaway_id,
+        "guild_id": interaction.guild.id,
         "prize": prize,
         "channel": interaction.channel,
+        "channel_id": interaction.channel.id,
         "winners": winners,
-        "participants": [],
+        "participants": ParticipantSet(),
         "end_time": end_time,
         "message": msg,
-        "host": interaction.user,
+        "message_id": msg.id,
+        "host_id": interaction.user.id,
         "view": view,
-        "requirements": requirements
+        "requirements": requirements,
+        "rules": rules,
+        "role_weights": role_weights
     }
-    view.giveaway_id = giveaway_id
+    active_giveaways[giveaway_id] = giveaway
+    giveaway_journal.start(giveaway_record(giveaway))
 
     await interaction.response.send_message(f"✅ Giveaway **{prize}** started!", ephemeral=True)
 
-    # Countdown loop
-    async def countdown():
-        while True:
-            giveaway = active_giveaways.get(giveaway_id)
-            if not giveaway:
-                break
-            time_left = int(giveaway["end_time"] - asyncio.get_event_loop().time())
-            if time_left <= 0:
-                active_giveaways.pop(giveaway_id, None)
-                await announce_winner(giveaway)
-                break
-            await update_embed(giveaway)
-            await asyncio.sleep(5)
-
-    bot.loop.create_task(countdown())
+    giveaway_scheduler.schedule(giveaway_id, time.time())
 
 # -------------------- Reroll --------------------
 @bot.tree.command(name="reroll", description="Reroll the latest giveaway")
 async def reroll_cmd(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         return await interaction.response.send_message("❌ Only staff can reroll.", ephemeral=True)
-    if not active_giveaways:
-        return await interaction.response.send_message("❌ No active giveaways.", ephemeral=True)
-    giveaway_id = max(active_giveaways.keys())
-    giveaway = active_giveaways[giveaway_id]
-    await announce_winner(giveaway, reroll=True)
+    if ended_giveaways:
+        giveaway = next(reversed(ended_giveaways.values()))
+    elif active_giveaways:
+        giveaway = active_giveaways[max(active_giveaways.keys())]
+    else:
+        return await interaction.response.send_message("❌ No giveaways to reroll.", ephemeral=True)
     await interaction.response.send_message(f"🔄 Giveaway **{giveaway['prize']}** rerolled.", ephemeral=True)
+    await announce_winner(giveaway, reroll=True)
 
 # -------------------- Manual Winner --------------------
 @bot.tree.command(name="choose", description="Choose a specific winner for the latest giveaway")
@@ -760,49 +2100,151 @@ def get_update_interval(seconds_left):
     else:
         return 1           # last minute
 
+# -------------------- Timers --------------------
+# Every .timer lives in one timing wheel; rows in timers.db let them resume after a restart.
+timer_store = TimerStore(os.path.join(DATA_DIR, "timers.db"))
+running_timers = timer_store.load()  # timer_id -> row
+timers_per_user = defaultdict(int)
+timers_per_guild = defaultdict(int)
+
+def count_timer(user_id, guild_id, delta):
+    timers_per_user[user_id] += delta
+    if guild_id is not None:  # DM timers only count against the user
+        timers_per_guild[guild_id] += delta
+
+for _timer in running_timers.values():
+    count_timer(_timer["user_id"], _timer["guild_id"], 1)
+
+def timer_content(timer_id, remaining):
+    return (
+        f"⏱ **Timer Running** `#{timer_id}`\n"
+        f"⏳ Time Left: `{format_time(remaining)}`"
+    )
+
+async def finish_timer(timer_id):
+    timer = running_timers.pop(timer_id, None)
+    timer_engine.cancel(timer_id)
+    if timer:
+        count_timer(timer["user_id"], timer["guild_id"], -1)
+        await asyncio.to_thread(timer_store.remove, timer_id)
+    return timer
+
+@metrics.timed("scheduler_job_duration_seconds", job="timer")
+async def tick_timer(timer_id):
+    timer = running_timers.get(timer_id)
+    if not timer:
+        return None
+    channel = bot.get_channel(timer["channel_id"])
+    if channel is None:
+        await finish_timer(timer_id)
+        return None
+    message = channel.get_partial_message(timer["message_id"])
+    remaining = int(timer["end_at"] - time.time())
+    try:
+        if remaining <= 0:
+            await finish_timer(timer_id)
+            await message.edit(
+                content=f"⏰ **TIME UP!**\n<@{timer['user_id']}> your timer has ended."
+            )
+            return None
+        await message.edit(content=timer_content(timer_id, remaining))
+    except discord.HTTPException:
+        await finish_timer(timer_id)  # message deleted / no perms
+        return None
+    return time.time() + min(get_update_interval(remaining), remaining)
+
+timer_engine = TimerEngine(tick_timer)
+
+async def close_timer_store():
+    # Stop ticking first so no timer finishes against a closed database
+    await timer_engine.close()
+    await asyncio.to_thread(timer_store.close)
+
+shutdown_hooks.append(close_timer_store)
+
 @bot.command(name="timer")
 async def timer_cmd(ctx, duration: str):
     total_seconds = parse_time_simple(duration)
     if not total_seconds or total_seconds <= 0:
         return await ctx.send("❌ Use format: `10s`, `5m`, `2h`, `1d`, `15d`")
 
-    end_time = asyncio.get_event_loop().time() + total_seconds
+    guild_id = ctx.guild.id if ctx.guild else None
+    if timers_per_user[ctx.author.id] >= TIMER_MAX_PER_USER:
+        return await ctx.send(f"❌ You already have {TIMER_MAX_PER_USER} timers running. Cancel one with `.timer_cancel <id>`.")
+    if guild_id is not None and timers_per_guild[guild_id] >= TIMER_MAX_PER_GUILD:
+        return await ctx.send("❌ This server has too many timers running right now.")
 
-    msg = await ctx.send(
-        f"⏱ **Timer Started**\n"
-        f"⏳ Time Left: `{format_time(total_seconds)}`"
-    )
-
-    while True:
-        remaining = int(end_time - asyncio.get_event_loop().time())
-        if remaining <= 0:
-            break
-
-        interval = get_update_interval(remaining)
+    # Reserve the slots before the first await so concurrent .timer calls can't all pass the check
+    count_timer(ctx.author.id, guild_id, 1)
+    end_at = time.time() + total_seconds
+    try:
+        msg = await ctx.send(
+            f"⏱ **Timer Started**\n"
+            f"⏳ Time Left: `{format_time(total_seconds)}`"
+        )
+        timer_id = await asyncio.to_thread(timer_store.add, guild_id, ctx.channel.id, msg.id, ctx.author.id, end_at)
+    except Exception:
+        count_timer(ctx.author.id, guild_id, -1)
+        raise
+    running_timers[timer_id] = {
+        "id": timer_id,
+        "guild_id": guild_id,
+        "channel_id": ctx.channel.id,
+        "message_id": msg.id,
+        "user_id": ctx.author.id,
+        "end_at": end_at,
+    }
+    timer_engine.schedule(timer_id, time.time())
 
+@bot.command(name="timers")
+async def timers_cmd(ctx):
+    guild_id = ctx.guild.id if ctx.guild else None
+    if staff_only(ctx):
+        mine = [t for t in running_timers.values() if t["guild_id"] == guild_id]
+    else:
+        mine = [t for t in running_timers.values() if t["user_id"] == ctx.author.id]
+    if not mine:
+        return await ctx.send("⏱ No timers running.")
+    now = time.time()
+    lines = [
+        f"`#{t['id']}` <@{t['user_id']}> — `{format_time(max(0, int(t['end_at'] - now)))}` left in <#{t['channel_id']}>"
+        for t in sorted(mine, key=lambda t: t["end_at"])[:20]
+    ]
+    await ctx.send("⏱ **Running Timers**\n" + "\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+@bot.command(name="timer_cancel")
+async def timer_cancel_cmd(ctx, timer_id: int):
+    timer = running_timers.get(timer_id)
+    if not timer or (timer["user_id"] != ctx.author.id and not staff_only(ctx)):
+        return await ctx.send("❌ No such timer.")
+    await finish_timer(timer_id)
+    channel = bot.get_channel(timer["channel_id"])
+    if channel:
         try:
-            await msg.edit(
-                content=(
-                    f"⏱ **Timer Running**\n"
-                    f"⏳ Time Left: `{format_time(remaining)}`"
-                )
-            )
-        except:
-            return  # message deleted / no perms
+            await channel.get_partial_message(timer["message_id"]).edit(content="⏹ **Timer cancelled.**")
+        except discord.HTTPException:
+            pass
+    await ctx.send(f"✅ Timer `#{timer_id}` cancelled.")
 
-        await asyncio.sleep(interval)
 
-    await msg.edit(
-        content=f"⏰ **TIME UP!**\n{ctx.author.mention} your timer has ended."
-    )
+# MOds
 
+async def send_log_embeds(channel_id, embeds):
+    # Fetches the channel when it isn't cached; a deleted channel raises, so the batcher counts the batch as failed
+    channel = await resolve_channel(channel_id)
+    await channel.send(embeds=embeds)
 
-# MOds
+# Log embeds are buffered and sent up to 10 per message, so a burst of actions
+# costs a few messages and no moderator waits on the log channel.
+log_batcher = EmbedBatcher(send_log_embeds, interval=MOD_LOG_FLUSH_SECONDS)
+shutdown_hooks.append(log_batcher.close)
 
-async def send_mod_log(guild, action, moderator, target, reason=None, duration=None):
+def send_mod_log(guild, action, moderator, target, reason=None, duration=None):
+    """Record a case and queue its log embed; returns the case ID."""
+    case_id = case_store.record(guild.id, action, target.id, str(target), moderator.id, reason, duration)
     channel = guild.get_channel(MOD_LOG_CHANNEL_ID)
     if not channel:
-        return
+        return case_id
 
     embed = discord.Embed(
         title=f"🔨 {action}",
@@ -815,15 +2257,39 @@ async def send_mod_log(guild, action, moderator, target, reason=None, duration=N
         embed.add_field(name="Reason", value=reason, inline=False)
     if duration:
         embed.add_field(name="Duration", value=duration, inline=False)
+    embed.set_footer(text=f"Case #{case_id}")
 
-    await channel.send(embed=embed)
+    log_batcher.add(channel.id, embed)
+    return case_id
 
 
-async def try_dm(user, message):
-    try:
-        await user.send(message)
-    except:
-        pass
+async def apply_timeout(guild, moderator, member, minutes, reason):
+    """Time a member out, DM them and write the mod log; shared by .timeout and anti-spam."""
+    duration = timedelta(minutes=minutes)
+
+    await member.edit(
+        timed_out_until=discord.utils.utcnow() + duration,
+        reason=reason
+    )
+
+    await try_dm(
+        member,
+        f"⏱ You were **TIMED OUT** in **{guild.name}**\n"
+        f"🕒 Duration: {minutes} minutes\n📄 Reason: {reason}"
+    )
+
+    send_mod_log(guild, "Timeout", moderator, member, reason, f"{minutes} minutes")
+
+
+async def try_dm(user, message, wait=0):
+    """Queue a moderation DM; with `wait`, block up to that many seconds for it to land."""
+    done = dm_queue.submit("moderation", user.id, lambda: user.send(message), priority=PRIORITY_MODERATION)
+    if wait:
+        try:
+            # Shielded so giving up on the wait doesn't cancel the delivery
+            await asyncio.wait_for(asyncio.shield(done), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
 
 
 @bot.command()
@@ -832,14 +2298,27 @@ async def ban(ctx, member: discord.Member, *, reason="No reason provided"):
     if member.top_role >= ctx.author.top_role:
         return await ctx.send("❌ You cannot ban this user.")
 
+    # Optional leading duration: `.ban @user 7d reason` is a temporary ban
+    first, _, rest = reason.partition(" ")
+    seconds = parse_time(first)
+    if seconds:
+        reason = rest.strip() or "No reason provided"
+    length = format_time(seconds) if seconds else None
+
     await try_dm(
         member,
         f"🔨 You were **BANNED** from **{ctx.guild.name}**\n📄 Reason: {reason}"
+        + (f"\n⏳ Duration: {length}" if length else ""),
+        wait=DM_BEFORE_ACTION_TIMEOUT,  # must arrive while we still share a server
     )
 
     await member.ban(reason=reason)
-    await ctx.send(f"✅ {member.mention} banned.")
-    await send_mod_log(ctx.guild, "Ban", ctx.author, member, reason)
+    if seconds:
+        await schedule_expiry("unban", ctx.guild.id, member.id, seconds)
+    else:
+        await asyncio.to_thread(expiry_store.cancel, "unban", ctx.guild.id, member.id)  # a permanent ban replaces any tempban
+    await ctx.send(f"✅ {member.mention} banned{f' for {length}' if length else ''}.")
+    send_mod_log(ctx.guild, "Ban", ctx.author, member, reason, length)
 
 
 @bot.command()
@@ -850,12 +2329,13 @@ async def kick(ctx, member: discord.Member, *, reason="No reason provided"):
 
     await try_dm(
         member,
-        f"👢 You were **KICKED** from **{ctx.guild.name}**\n📄 Reason: {reason}"
+        f"👢 You were **KICKED** from **{ctx.guild.name}**\n📄 Reason: {reason}",
+        wait=DM_BEFORE_ACTION_TIMEOUT,
     )
 
     await member.kick(reason=reason)
     await ctx.send(f"✅ {member.mention} kicked.")
-    await send_mod_log(ctx.guild, "Kick", ctx.author, member, reason)
+    send_mod_log(ctx.guild, "Kick", ctx.author, member, reason)
 
 
 @bot.command()
@@ -864,21 +2344,8 @@ async def timeout(ctx, member: discord.Member, minutes: int, *, reason="No reaso
     if member.top_role >= ctx.author.top_role:
         return await ctx.send("❌ You cannot timeout this user.")
 
-    duration = timedelta(minutes=minutes)
-
-    await member.edit(
-        timed_out_until=discord.utils.utcnow() + duration,
-        reason=reason
-    )
-
-    await try_dm(
-        member,
-        f"⏱ You were **TIMED OUT** in **{ctx.guild.name}**\n"
-        f"🕒 Duration: {minutes} minutes\n📄 Reason: {reason}"
-    )
-
+    await apply_timeout(ctx.guild, ctx.author, member, minutes, reason)
     await ctx.send(f"⏱ {member.mention} timed out for {minutes} minutes.")
-    await send_mod_log(ctx.guild, "Timeout", ctx.author, member, reason, f"{minutes} minutes")
 
 
 @bot.command()
@@ -890,8 +2357,359 @@ async def unban(ctx, user_id: int, *, reason="No reason provided"):
     except:
         return await ctx.send("❌ Invalid user ID or user not banned.")
 
+    await asyncio.to_thread(expiry_store.cancel, "unban", ctx.guild.id, user.id)
     await ctx.send(f"✅ {user} unbanned.")
-    await send_mod_log(ctx.guild, "Unban", ctx.author, user, reason)
+    send_mod_log(ctx.guild, "Unban", ctx.author, user, reason)
+
+
+# -------------------- TEMP BANS / TEMP ROLES --------------------
+EXPIRY_RETRY_SECONDS = 60
+
+expiry_store = ExpiryStore(os.path.join(DATA_DIR, "expiries.db"))
+
+async def close_expiry_store():
+    await asyncio.to_thread(expiry_store.close)
+
+shutdown_hooks.append(close_expiry_store)
+
+async def run_expiry(row):
+    """Undo one temp ban / temp role; returns a retry time on transient errors, else None."""
+    guild = bot.get_guild(row["guild_id"])
+    if guild is None:
+        return None  # bot is no longer in that server
+    try:
+        if row["kind"] == "unban":
+            user = bot.get_user(row["user_id"]) or await bot.fetch_user(row["user_id"])
+            await guild.unban(user, reason="Temporary ban expired")
+            send_mod_log(guild, "Unban", guild.me, user, "Temporary ban expired")
+        elif row["kind"] == "unrole":
+            role = guild.get_role(row["role_id"])
+            member = await resolve_member(guild, row["user_id"])
+            if role is None or member is None:
+                return None  # role deleted or member left
+            # Removing a role the member no longer has is a no-op, so no need to trust cached roles
+            await member.remove_roles(role, reason="Temporary role expired")
+            send_mod_log(guild, "Temp Role Expired", guild.me, member, f"Removed {role.name}")
+    except (discord.NotFound, discord.Forbidden) as e:
+        print(f"Dropping expiry #{row['id']} ({row['kind']}): {e}")
+        return None
+    except discord.HTTPException:
+        return time.time() + EXPIRY_RETRY_SECONDS
+    return None
+
+expiry_waiter = ExpiryWaiter(expiry_store, run_expiry)
+
+async def schedule_expiry(kind, guild_id, user_id, seconds, role_id=0):
+    await asyncio.to_thread(expiry_store.add, kind, guild_id, user_id, time.time() + seconds, role_id=role_id)
+    expiry_waiter.notify()
+
+@bot.command(name="temprole")
+@commands.has_permissions(manage_roles=True)
+async def temprole(ctx, member: discord.Member, role: discord.Role, duration: str, *, reason="No reason provided"):
+    seconds = parse_time(duration)
+    if not seconds:
+        return await ctx.send("❌ Usage: `.temprole @member @role <10m/1h/7d> [reason]`")
+    if role >= ctx.author.top_role and ctx.author.id != ctx.guild.owner_id:
+        return await ctx.send("❌ You cannot assign this role.")
+    if role >= ctx.guild.me.top_role:
+        return await ctx.send("❌ That role is above mine, I can't assign it.")
+
+    await member.add_roles(role, reason=f"{reason} (temporary, {duration})")
+    await schedule_expiry("unrole", ctx.guild.id, member.id, seconds, role_id=role.id)
+    await ctx.send(
+        f"✅ Gave {role.mention} to {member.mention} for {format_time(seconds)}.",
+        allowed_mentions=discord.AllowedMentions.none()
+    )
+    send_mod_log(ctx.guild, "Temp Role", ctx.author, member, f"{role.name}: {reason}", format_time(seconds))
+
+
+# -------------------- MASS MODERATION --------------------
+MASS_ACTION_MAX = int(os.getenv("MASS_ACTION_MAX", 1000))  # targets per command
+MASS_ACTION_CONCURRENCY = int(os.getenv("MASS_ACTION_CONCURRENCY", 5))
+BULK_BAN_CHUNK = 200  # Discord's bulk-ban limit per request
+
+def parse_mass_targets(ctx, text):
+    """Parse mass-action arguments into (user_ids, reason, delete_seconds).
+
+    Targets: user IDs or mentions in any layout (a pasted list works), and/or
+    joined:<dur> for everyone who joined within that window. delete:<dur>
+    (bans only, max 7d) removes recent messages; reason:<text> takes the rest
+    of the line. Returns an error string when something doesn't parse.
+    """
+    text, _, reason = text.partition("reason:")
+    user_ids = {}
+    delete_seconds = 0
+    for token in text.replace(",", " ").split():
+        key, _, value = token.lower().partition(":")
+        mention = re.fullmatch(r"<@!?(\d+)>|\(?(\d{15,20})\)?", token)
+        if mention:
+            user_ids[int(next(g for g in mention.groups() if g))] = None
+        elif key == "joined" and parse_time(value):
+            cutoff = discord.utils.utcnow() - timedelta(seconds=parse_time(value))
+            for member in ctx.guild.members:
+                if member.joined_at and member.joined_at >= cutoff:
+                    user_ids[member.id] = None
+            # The join log also covers members discord.py isn't caching
+            for joined_at, user_id in join_log[ctx.guild.id]:
+                if joined_at >= cutoff.timestamp():
+                    user_ids[user_id] = None
+        elif key == "delete" and parse_time(value):
+            delete_seconds = min(parse_time(value), 7 * 86400)
+        else:
+            return f"❌ Don't understand `{token}`."
+    return list(user_ids), reason.strip() or "Mass moderation", delete_seconds
+
+async def mass_action_protected(ctx, user_id):
+    """True if the caller may not act on user_id; unknown membership counts as protected."""
+    guild = ctx.guild
+    if user_id in (ctx.author.id, bot.user.id, guild.owner_id) or user_id in STAFF_IDS:
+        return True
+    member = guild.get_member(user_id) or active_members.get(guild.id, user_id)
+    if member is None:
+        # Lazy/active cache modes miss most members, so ask the API rather than assume
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return False  # not in the server: no role to outrank
+        except discord.HTTPException:
+            return True
+    return member.top_role >= ctx.author.top_role and ctx.author.id != guild.owner_id
+
+async def find_protected(ctx, user_ids):
+    semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+
+    async def check(user_id):
+        async with semaphore:
+            return await mass_action_protected(ctx, user_id)
+
+    flags = await asyncio.gather(*(check(user_id) for user_id in user_ids))
+    return {user_id for user_id, protected in zip(user_ids, flags) if protected}
+
+async def run_limited(user_ids, action):
+    """Run action(user_id) with bounded concurrency; returns (succeeded, {user_id: error})."""
+    semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+    succeeded, failed = [], {}
+
+    async def one(user_id):
+        async with semaphore:
+            try:
+                await action(user_id)
+                succeeded.append(user_id)
+            except discord.HTTPException as e:
+                failed[user_id] = e.text or type(e).__name__
+
+    await asyncio.gather(*(one(user_id) for user_id in user_ids))
+    return succeeded, failed
+
+async def mass_ban(guild, user_ids, reason, delete_seconds):
+    async def ban_one(user_id):
+        await guild.ban(discord.Object(id=user_id), reason=reason, delete_message_seconds=delete_seconds)
+
+    if not hasattr(guild, "bulk_ban"):  # discord.py < 2.4
+        return await run_limited(user_ids, ban_one)
+
+    succeeded, failed = [], {}
+    for start in range(0, len(user_ids), BULK_BAN_CHUNK):
+        chunk = user_ids[start:start + BULK_BAN_CHUNK]
+        try:
+            result = await guild.bulk_ban(
+                [discord.Object(id=user_id) for user_id in chunk], reason=reason, delete_message_seconds=delete_seconds
+            )
+        except discord.HTTPException as e:
+            print(f"Bulk ban failed ({e}); banning this chunk one by one.")
+            chunk_ok, chunk_failed = await run_limited(chunk, ban_one)
+            succeeded += chunk_ok
+            failed.update(chunk_failed)
+            continue
+        succeeded += [user.id for user in result.banned]
+        failed.update({user.id: "not banned" for user in result.failed})
+    return succeeded, failed
+
+async def mass_kick(guild, user_ids, reason):
+    async def kick_one(user_id):
+        await guild.kick(discord.Object(id=user_id), reason=reason)
+
+    return await run_limited(user_ids, kick_one)
+
+def send_mass_mod_log(guild, action, moderator, reason, succeeded, failed):
+    # One case per target so /cases <user> finds it; one embed for the whole run
+    case_ids = [
+        case_store.record(guild.id, action, user_id, None, moderator.id, f"[mass] {reason}") for user_id in succeeded
+    ]
+    channel = guild.get_channel(MOD_LOG_CHANNEL_ID)
+    if not channel:
+        return
+
+    embed = discord.Embed(
+        title=f"🔨 Mass {action}",
+        color=discord.Color.red(),
+        timestamp=discord.utils.utcnow()
+    )
+    embed.add_field(name="Moderator", value=moderator.mention, inline=False)
+    embed.add_field(name="Reason", value=reason, inline=False)
+    embed.add_field(name="Result", value=f"✅ {len(succeeded)} succeeded | ❌ {len(failed)} failed", inline=False)
+    if succeeded:
+        embed.add_field(name="Targets", value=" ".join(str(user_id) for user_id in succeeded)[:1024], inline=False)
+    if failed:
+        lines = "\n".join(f"{user_id}: {error}" for user_id, error in failed.items())
+        embed.add_field(name="Failures", value=lines[:1024], inline=False)
+    if case_ids:
+        embed.set_footer(text=f"Cases #{case_ids[0]}–#{case_ids[-1]}")
+
+    log_batcher.add(channel.id, embed)
+
+class ConfirmView(View):
+    def __init__(self, owner_id):
+        super().__init__(timeout=60)
+        self.owner_id = owner_id
+        self.confirmed = False
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Only the moderator who ran this can confirm.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Confirm", style=discord.ButtonStyle.red)
+    async def confirm(self, interaction: discord.Interaction, button: Button):
+        self.confirmed = True
+        await interaction.response.defer()
+        self.stop()
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.grey)
+    async def cancel(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.defer()
+        self.stop()
+
+async def run_mass_action(ctx, action, args):
+    parsed = parse_mass_targets(ctx, args)
+    if isinstance(parsed, str):
+        return await ctx.send(parsed)
+    user_ids, reason, delete_seconds = parsed
+
+    # Cap before the protection check, which may fetch every target
+    if len(user_ids) > MASS_ACTION_MAX:
+        return await ctx.send(f"❌ {len(user_ids)} targets is over the limit of {MASS_ACTION_MAX}.")
+    protected = await find_protected(ctx, user_ids)
+    user_ids = [user_id for user_id in user_ids if user_id not in protected]
+    if not user_ids:
+        return await ctx.send(f"❌ No targets. Usage: `.mass{action} <ids/mentions...> [joined:10m] [reason:<text>]`")
+
+    view = ConfirmView(ctx.author.id)
+    skipped = f" ({len(protected)} protected skipped)" if protected else ""
+    prompt = await ctx.send(f"⚠️ **{action.title()} {len(user_ids)} users**{skipped}?\n📄 Reason: {reason}", view=view)
+    await view.wait()
+    if not view.confirmed:
+        return await prompt.edit(content="❎ Mass action cancelled.", view=None)
+
+    await prompt.edit(content=f"⏳ Running mass {action} on {len(user_ids)} users...", view=None)
+    full_reason = f"{reason} (by {ctx.author})"
+    # No DMs here: a raid wave would only burn the DM rate limit on throwaway accounts
+    if action == "ban":
+        succeeded, failed = await mass_ban(ctx.guild, user_ids, full_reason, delete_seconds)
+    else:
+        succeeded, failed = await mass_kick(ctx.guild, user_ids, full_reason)
+
+    await prompt.edit(content=f"✅ Mass {action}: {len(succeeded)} succeeded, {len(failed)} failed.")
+    send_mass_mod_log(ctx.guild, action.title(), ctx.author, reason, succeeded, failed)
+
+@bot.command(name="massban")
+@commands.has_permissions(ban_members=True)
+async def massban(ctx, *, args: str = ""):
+    await run_mass_action(ctx, "ban", args)
+
+@bot.command(name="masskick")
+@commands.has_permissions(kick_members=True)
+async def masskick(ctx, *, args: str = ""):
+    await run_mass_action(ctx, "kick", args)
+
+
+# -------------------- CASES --------------------
+case_store = CaseStore(os.path.join(DATA_DIR, "cases.db"))
+CASES_PAGE_SIZE = 10
+
+async def close_case_store():
+    await asyncio.to_thread(case_store.close)
+
+shutdown_hooks.append(close_case_store)
+
+def format_case_line(case):
+    reason = (case["reason"] or "No reason")[:80]
+    return (
+        f"`#{case['id']}` **{case['action']}** <@{case['target_id']}> by <@{case['moderator_id']}> "
+        f"<t:{int(case['created_at'])}:R> — {reason}"
+    )
+
+class CasesView(View):
+    """Newest-first case pages; keeps the cursor of every page seen so Previous is free."""
+
+    def __init__(self, owner_id, guild_id, target_id=None, moderator_id=None):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.query = {"guild_id": guild_id, "target_id": target_id, "moderator_id": moderator_id}
+        self.cursors = [None]  # before_id for each page visited
+        self.next_cursor = None
+
+    async def load(self):
+        rows, self.next_cursor = await asyncio.to_thread(
+            case_store.page, before_id=self.cursors[-1], limit=CASES_PAGE_SIZE, **self.query
+        )
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = self.next_cursor is None
+        embed = discord.Embed(title="📁 Moderation Cases", color=discord.Color.orange())
+        embed.description = "\n".join(format_case_line(case) for case in rows) or "No cases found."
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Run /cases yourself to browse.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Previous", emoji="⬅️", style=discord.ButtonStyle.grey)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+
+    @discord.ui.button(label="Next", emoji="➡️", style=discord.ButtonStyle.grey)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=await self.load(), view=self)
+
+@bot.tree.command(name="cases", description="Browse moderation cases")
+@app_commands.describe(user="Only cases against this user", moderator="Only cases by this moderator")
+async def cases_slash(interaction: discord.Interaction, user: discord.User = None, moderator: discord.User = None):
+    if not staff_only_slash(interaction):
+        return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
+    view = CasesView(
+        interaction.user.id,
+        interaction.guild.id,
+        target_id=user.id if user else None,
+        moderator_id=moderator.id if moderator else None,
+    )
+    await interaction.response.send_message(embed=await view.load(), view=view, ephemeral=True)
+
+@bot.tree.command(name="case", description="Show one moderation case")
+@app_commands.describe(case_id="Case number")
+async def case_slash(interaction: discord.Interaction, case_id: int):
+    if not staff_only_slash(interaction):
+        return await interaction.response.send_message("❌ You are not allowed to use this command.", ephemeral=True)
+    case = await asyncio.to_thread(case_store.get, interaction.guild.id, case_id)
+    if case is None:
+        return await interaction.response.send_message(f"❌ Case `#{case_id}` not found.", ephemeral=True)
+
+    embed = discord.Embed(
+        title=f"📁 Case #{case['id']} — {case['action']}",
+        color=discord.Color.orange(),
+        timestamp=datetime.fromtimestamp(case["created_at"], tz=pytz.utc)
+    )
+    embed.add_field(name="User", value=f"<@{case['target_id']}> ({case['target_name'] or case['target_id']})", inline=False)
+    embed.add_field(name="Moderator", value=f"<@{case['moderator_id']}>", inline=False)
+    embed.add_field(name="Reason", value=case["reason"] or "No reason", inline=False)
+    if case["duration"]:
+        embed.add_field(name="Duration", value=case["duration"], inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
 @bot.event
@@ -972,6 +2790,41 @@ class QRPaymentView(View):
             "✅ Payment confirmed successfully.",
             ephemeral=True
         )
+def upi_payload(amount):
+    return (
+        f"upi://pay?"
+        f"pa={UPI_ID}"
+        f"&pn={PAYEE_NAME}"
+        f"&am={amount}"
+        f"&cu=INR"
+    )
+
+def render_qr_png(payload):
+    # Runs on the QR worker pool, never on the event loop
+    qr = qrcode.make(payload)
+    buffer = io.BytesIO()
+    qr.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+qr_cache = QRCache(render_qr_png, max_bytes=int(QR_CACHE_MB * 1024 * 1024))
+
+async def close_qr_cache():
+    qr_cache.close()
+
+shutdown_hooks.append(close_qr_cache)
+
+@bot.command(name="qr_stats")
+async def qr_stats(ctx):
+    if ctx.author.id not in STAFF_IDS:
+        return await ctx.send("❌ Staff only command.")
+    stats = qr_cache.stats()
+    await ctx.send(
+        f"🧾 **QR Cache**\n"
+        f"Entries: **{stats['entries']}** ({format_bytes(stats['bytes'])} / {format_bytes(stats['max_bytes'])})\n"
+        f"Hit rate: **{stats['hit_rate']:.0%}** ({stats['hits']} hits / {stats['misses']} misses)\n"
+        f"Renders: {stats['renders']} | Avg render: {stats['avg_render_ms']:.1f} ms"
+    )
+
 @bot.command(name="qr")
 async def qr_cmd(ctx, amount: int = None, buyer: discord.Member = None):
     if ctx.author.id not in STAFF_IDS:
@@ -982,22 +2835,10 @@ async def qr_cmd(ctx, amount: int = None, buyer: discord.Member = None):
 
     buyer = buyer or ctx.author
 
-    # Create UPI link
-    upi_url = (
-        f"upi://pay?"
-        f"pa={UPI_ID}"
-        f"&pn={PAYEE_NAME}"
-        f"&am={amount}"
-        f"&cu=INR"
-    )
-
-    # Generate QR
-    qr = qrcode.make(upi_url)
-    buffer = io.BytesIO()
-    qr.save(buffer, format="PNG")
-    buffer.seek(0)
+    # Cached PNG for this UPI link, rendered off-loop on a miss
+    png = await qr_cache.get(upi_payload(amount))
 
-    file = discord.File(buffer, filename=f"QR_{amount}.png")
+    file = discord.File(io.BytesIO(png), filename=f"QR_{amount}.png")
 
     embed = discord.Embed(
         title="💳 UPI Payment",
@@ -1021,7 +2862,18 @@ ALLOWED_GUILDS = [GUILD_ID]
 @bot.event
 async def on_guild_join(guild):
     if guild.id not in ALLOWED_GUILDS:
-        await guild.leave()
+        return await guild.leave()
+    recount_members()
+    snapshot_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    guild_member_counts.pop(guild.id, None)
+    role_index.drop_guild(guild.id)
+    guild_snapshots.drop(guild.id)
+    active_members.drop_guild(guild.id)
+    join_log.pop(guild.id, None)
+    presence_wakeup.set()
 
 bot.run(TOKEN)
 
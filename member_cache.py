@@ -0,0 +1,71 @@
+import os
+from collections import OrderedDict
+
+MEMBER_CACHE_MODES = ("full", "lazy", "active")
+
+
+class ActiveMemberCache:
+    """Bounded LRU of recently active Member objects, for when discord.py's own cache is off.
+
+    Entries are refreshed whenever the member is seen again (a message, an
+    interaction, a fetch), so their roles are at most as stale as their last
+    activity. Pinned members (staff) are never evicted.
+    """
+
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self._members = OrderedDict()  # (guild_id, user_id) -> Member
+        self._pinned = {}  # (guild_id, user_id) -> Member
+
+    def __len__(self):
+        return len(self._members) + len(self._pinned)
+
+    def touch(self, member):
+        key = (member.guild.id, member.id)
+        if key in self._pinned:
+            self._pinned[key] = member
+            return
+        self._members[key] = member
+        self._members.move_to_end(key)
+        while len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+
+    def pin(self, member):
+        key = (member.guild.id, member.id)
+        self._members.pop(key, None)
+        self._pinned[key] = member
+
+    def get(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        member = self._pinned.get(key)
+        if member is not None:
+            return member
+        member = self._members.get(key)
+        if member is not None:
+            self._members.move_to_end(key)
+        return member
+
+    def discard(self, guild_id, user_id):
+        self._members.pop((guild_id, user_id), None)
+        self._pinned.pop((guild_id, user_id), None)
+
+    def drop_guild(self, guild_id):
+        for store in (self._members, self._pinned):
+            for key in [key for key in store if key[0] == guild_id]:
+                del store[key]
+
+
+def process_rss_bytes():
+    """Current resident set size, or peak RSS where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
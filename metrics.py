@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+
+# Seconds; wide enough for a 10 s REST retry, fine enough for sub-ms handlers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process histograms and gauges rendered as Prometheus text.
+
+    Observing is a bisect plus three adds, cheap enough to leave on for every
+    message and REST call. Rendering can run from another thread; it only reads.
+    """
+
+    def __init__(self, prefix="bot"):
+        self.prefix = prefix
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._gauges = {}  # name -> {labels: value}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        series = self._histograms.get(name)
+        if series is None:
+            series = self._histograms[name] = {}
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def set_gauge(self, name, value, **labels):
+        self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def timed(self, name, **labels):
+        """Decorator recording a coroutine function's duration, errors included."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    async def sample_loop_lag(self, interval=0.5):
+        """Measure how late the loop wakes a sleeper; lag here delays every handler."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - start - interval)
+            self.observe("event_loop_lag_seconds", lag)
+            self.set_gauge("event_loop_lag_seconds_last", lag)
+
+    def last_gauge(self, name, default=None, **labels):
+        return self._gauges.get(name, {}).get(tuple(sorted(labels.items())), default)
+
+    @staticmethod
+    def _labels(key, extra=None):
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        for name, series in list(self._histograms.items()):
+            full = f"{self.prefix}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} histogram")
+            for key, histogram in list(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{self._labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{full}_bucket{self._labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{full}_sum{self._labels(key)} {histogram.sum}")
+                lines.append(f"{full}_count{self._labels(key)} {histogram.count}")
+        for name, series in list(self._gauges.items()):
+            full = f"{self.prefix}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} gauge")
+            for key, value in list(series.items()):
+                lines.append(f"{full}{self._labels(key)} {value}")
+        return "\n".join(lines) + "\n"
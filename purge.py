@@ -0,0 +1,181 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+# Discord refuses bulk deletes of messages older than 14 days; stay a minute clear of the edge
+BULK_MAX_AGE = timedelta(days=14) - timedelta(minutes=1)
+BULK_SIZE = 100
+
+
+class PurgeFilter:
+    """Which messages a purge removes. Empty filter matches everything."""
+
+    def __init__(self, authors=(), pattern=None, bots_only=False, attachments_only=False,
+                 newer_than=None, older_than=None):
+        self.authors = set(authors)
+        self.pattern = pattern  # compiled regex, searched against message content
+        self.bots_only = bots_only
+        self.attachments_only = attachments_only
+        self.newer_than = newer_than  # seconds; only messages younger than this
+        self.older_than = older_than  # seconds; only messages older than this
+
+    def history_bounds(self, now):
+        """(after, before) datetimes so history() never pages outside the age window."""
+        after = now - timedelta(seconds=self.newer_than) if self.newer_than else None
+        before = now - timedelta(seconds=self.older_than) if self.older_than else None
+        return after, before
+
+    def matches(self, message):
+        if self.authors and message.author.id not in self.authors:
+            return False
+        if self.bots_only and not message.author.bot:
+            return False
+        if self.attachments_only and not message.attachments:
+            return False
+        if self.pattern is not None and not self.pattern.search(message.content or ""):
+            return False
+        return True
+
+    def describe(self):
+        parts = []
+        if self.authors:
+            parts.append("from " + ", ".join(f"<@{a}>" for a in self.authors))
+        if self.bots_only:
+            parts.append("bots only")
+        if self.attachments_only:
+            parts.append("with attachments")
+        if self.pattern is not None:
+            parts.append(f"matching `{self.pattern.pattern}`")
+        if self.newer_than:
+            parts.append(f"newer than {self.newer_than}s")
+        if self.older_than:
+            parts.append(f"older than {self.older_than}s")
+        return ", ".join(parts) or "all messages"
+
+
+class PurgeJob:
+    """Streams channel history and deletes matching messages.
+
+    History is consumed page by page, never collected. Messages young enough
+    for bulk delete are sent in batches of 100 per channel; older ones are
+    deleted one by one by at most `concurrency` in-flight requests, and the
+    history scan waits when that pool is full so memory stays flat however
+    large the purge. Without a limit, channels run side by side; with one they
+    run in the order given, so which messages go doesn't depend on timing.
+    `cancel()` stops scanning and lets in-flight requests finish.
+    """
+
+    def __init__(self, channels, purge_filter, limit=None, scan_limit=None, concurrency=4,
+                 protected=(), clock=lambda: datetime.now(timezone.utc)):
+        self.channels = list(channels)
+        self.filter = purge_filter
+        self.limit = limit  # max messages to delete across all channels
+        self.scan_limit = scan_limit  # max messages to read per channel
+        self.protected = set(protected)  # message IDs never deleted (e.g. the status message)
+        self.start_before = None  # scan starts below this message (e.g. the status message)
+        self.clock = clock
+        self._single = asyncio.Semaphore(concurrency)
+        self._cancelled = False
+        self.scanned = 0
+        self.matched = 0
+        self.deleted = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _should_stop(self):
+        return self._cancelled or (self.limit is not None and self.matched >= self.limit)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        try:
+            if self.limit is None:
+                await asyncio.gather(*(self._purge_channel(channel) for channel in self.channels))
+            else:
+                for channel in self.channels:
+                    if self._should_stop():
+                        break
+                    await self._purge_channel(channel)
+        finally:
+            self.finished_at = time.monotonic()
+        return self
+
+    async def _purge_channel(self, channel):
+        now = self.clock()
+        bulk_cutoff = now - BULK_MAX_AGE
+        after, before = self.filter.history_bounds(now)
+        if before is None:
+            # Otherwise the status message would be the first thing scanned and eat a slot of scan_limit
+            before = self.start_before
+        batch = []
+        singles = set()
+
+        async for message in channel.history(limit=self.scan_limit, after=after, before=before, oldest_first=False):
+            if self._should_stop():
+                break
+            self.scanned += 1
+            if message.id in self.protected or not self.filter.matches(message):
+                continue
+            self.matched += 1
+            if message.created_at > bulk_cutoff:
+                batch.append(message)
+                if len(batch) >= BULK_SIZE:
+                    await self._bulk(channel, batch)
+                    batch = []
+            else:
+                # Backpressure: the scan pauses while the single-delete pool is full
+                await self._single.acquire()
+                task = asyncio.create_task(self._delete_one(message))
+                singles.add(task)
+                task.add_done_callback(singles.discard)
+
+        if batch:
+            await self._bulk(channel, batch)
+        if singles:
+            await asyncio.gather(*singles)
+
+    async def _bulk(self, channel, messages):
+        try:
+            if len(messages) == 1:
+                await messages[0].delete()
+            else:
+                await channel.delete_messages(messages)
+            self.deleted += len(messages)
+        except Exception as e:
+            # Fall back to one-by-one so a single bad message doesn't sink the batch
+            print(f"Bulk delete of {len(messages)} failed in {channel}: {e}")
+            for message in messages:
+                await self._single.acquire()
+                await self._delete_one(message)
+
+    async def _delete_one(self, message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except Exception:
+            self.failed += 1
+        finally:
+            self._single.release()
+
+    def progress_text(self):
+        state = "cancelled" if self._cancelled else ("done" if self.finished_at else "running")
+        rate = self.deleted / self.elapsed if self.elapsed else 0.0
+        return (
+            f"🧹 **Purge {state}** — {self.filter.describe()}\n"
+            f"Scanned **{self.scanned}** | Matched **{self.matched}** | Deleted **{self.deleted}**"
+            f"{f' | Failed **{self.failed}**' if self.failed else ''}\n"
+            f"{len(self.channels)} channel(s) | {self.elapsed:.0f}s | {rate:.1f} msg/s"
+        )
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QRCache:
+    """LRU cache of rendered QR PNGs keyed by payload, bounded by total bytes.
+
+    Misses are rendered by `render(payload) -> bytes` on a small worker pool so
+    the event loop never runs qrcode/PIL itself. Concurrent misses for the same
+    payload share one render.
+    """
+
+    def __init__(self, render, max_bytes=8 * 1024 * 1024, workers=2):
+        self._render = render
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # payload -> png bytes
+        self._bytes = 0
+        self._inflight = {}  # payload -> Future
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qr-render")
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def _timed_render(self, payload):
+        start = time.perf_counter()
+        png = self._render(payload)
+        return png, time.perf_counter() - start
+
+    def _store(self, payload, png):
+        if len(png) > self.max_bytes:
+            return
+        self._entries[payload] = png
+        self._bytes += len(png)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    async def get(self, payload):
+        png = self._entries.get(payload)
+        if png is not None:
+            self._entries.move_to_end(payload)
+            self.hits += 1
+            return png
+
+        self.misses += 1
+        future = self._inflight.get(payload)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, self._timed_render, payload)
+            self._inflight[payload] = future
+            try:
+                png, elapsed = await asyncio.shield(future)
+            finally:
+                self._inflight.pop(payload, None)
+            self.renders += 1
+            self.render_seconds += elapsed
+            self._store(payload, png)
+            return png
+        png, _ = await asyncio.shield(future)
+        return png
+
+    async def prewarm(self, payloads):
+        await asyncio.gather(*(self.get(payload) for payload in payloads if payload not in self._entries))
+        # Warm-up renders shouldn't count against the hit rate
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "renders": self.renders,
+            "avg_render_ms": self.render_seconds / self.renders * 1000 if self.renders else 0.0,
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,117 @@
+import csv
+import gzip
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+RECEIPT_COLUMNS = ("id", "guild_id", "buyer_id", "buyer_name", "item", "price", "staff_id", "staff_name", "created_at")
+
+
+class ReceiptLedger:
+    """Append-only SQLite ledger of purchase receipts.
+
+    IDs come from AUTOINCREMENT, so they only ever grow and are never reused,
+    even after a failed insert. Triggers reject UPDATE and DELETE, so a
+    receipt can't be changed once issued. Lookups by ID are a primary-key
+    seek; buyer, staff and time have their own indexes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS receipts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "guild_id INTEGER, "
+            "buyer_id INTEGER NOT NULL, "
+            "buyer_name TEXT NOT NULL, "
+            "item TEXT NOT NULL, "
+            "price TEXT NOT NULL, "
+            "staff_id INTEGER NOT NULL, "
+            "staff_name TEXT NOT NULL, "
+            "created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS receipts_buyer ON receipts (buyer_id, id);"
+            "CREATE INDEX IF NOT EXISTS receipts_staff ON receipts (staff_id, id);"
+            "CREATE INDEX IF NOT EXISTS receipts_time ON receipts (created_at);"
+            "CREATE TRIGGER IF NOT EXISTS receipts_no_update BEFORE UPDATE ON receipts "
+            "BEGIN SELECT RAISE(ABORT, 'receipts are append-only'); END;"
+            "CREATE TRIGGER IF NOT EXISTS receipts_no_delete BEFORE DELETE ON receipts "
+            "BEGIN SELECT RAISE(ABORT, 'receipts are append-only'); END;"
+        )
+        self._conn.commit()
+
+    def issue(self, guild_id, buyer_id, buyer_name, item, price, staff_id, staff_name, created_at=None):
+        """Append a receipt and return it as a dict, ID included."""
+        row = {
+            "guild_id": guild_id,
+            "buyer_id": buyer_id,
+            "buyer_name": buyer_name,
+            "item": item,
+            "price": price,
+            "staff_id": staff_id,
+            "staff_name": staff_name,
+            "created_at": created_at or time.time(),
+        }
+        columns = RECEIPT_COLUMNS[1:]
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO receipts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(row[c] for c in columns),
+            )
+        row["id"] = cursor.lastrowid
+        return row
+
+    def get(self, receipt_id):
+        with self._lock:
+            found = self._conn.execute(
+                f"SELECT {', '.join(RECEIPT_COLUMNS)} FROM receipts WHERE id = ?", (receipt_id,)
+            ).fetchone()
+        return dict(zip(RECEIPT_COLUMNS, found)) if found else None
+
+    def export_csv(self, path, since=None, buyer_id=None, staff_id=None, compress=False, batch=1000):
+        """Stream matching receipts (oldest first) into a CSV file; returns the row count.
+
+        Uses its own read connection and fetches `batch` rows at a time, so
+        memory stays flat and issuing receipts isn't blocked meanwhile.
+        """
+        where, args = [], []
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        if buyer_id is not None:
+            where.append("buyer_id = ?")
+            args.append(buyer_id)
+        if staff_id is not None:
+            where.append("staff_id = ?")
+            args.append(staff_id)
+        query = f"SELECT {', '.join(RECEIPT_COLUMNS)} FROM receipts"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY id"
+
+        reader = sqlite3.connect(self.path)
+        opener = gzip.open if compress else open
+        count = 0
+        try:
+            with opener(path, "wt", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(RECEIPT_COLUMNS + ("created_at_utc",))
+                cursor = reader.execute(query, args)
+                while True:
+                    rows = cursor.fetchmany(batch)
+                    if not rows:
+                        break
+                    for row in rows:
+                        issued = datetime.fromtimestamp(row[-1], tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                        writer.writerow(row + (issued,))
+                    count += len(rows)
+        finally:
+            reader.close()
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,63 @@
+class RoleIndex:
+    """Per-guild role -> member-ID sets, kept current from member/role events.
+
+    Lets hot paths (giveaway joins) answer "does this member have role X?" with a
+    set lookup instead of walking member.roles. Guilds that were never built
+    report None so callers can fall back to the member object.
+    """
+
+    def __init__(self):
+        self._guilds = {}  # guild_id -> {role_id: set(member_id)}
+
+    def build(self, guild_id, members):
+        """Rebuild a guild from an iterable of (member_id, role_ids)."""
+        roles = {}
+        for member_id, role_ids in members:
+            for role_id in role_ids:
+                roles.setdefault(role_id, set()).add(member_id)
+        self._guilds[guild_id] = roles
+
+    def is_indexed(self, guild_id):
+        return guild_id in self._guilds
+
+    def add_member(self, guild_id, member_id, role_ids):
+        roles = self._guilds.get(guild_id)
+        if roles is None:
+            return
+        for role_id in role_ids:
+            roles.setdefault(role_id, set()).add(member_id)
+
+    def remove_member(self, guild_id, member_id, role_ids):
+        roles = self._guilds.get(guild_id)
+        if roles is None:
+            return
+        for role_id in role_ids:
+            members = roles.get(role_id)
+            if members:
+                members.discard(member_id)
+
+    def update_member(self, guild_id, member_id, old_role_ids, new_role_ids):
+        old_role_ids, new_role_ids = set(old_role_ids), set(new_role_ids)
+        self.remove_member(guild_id, member_id, old_role_ids - new_role_ids)
+        self.add_member(guild_id, member_id, new_role_ids - old_role_ids)
+
+    def remove_role(self, guild_id, role_id):
+        roles = self._guilds.get(guild_id)
+        if roles is not None:
+            roles.pop(role_id, None)
+
+    def drop_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+    def missing_roles(self, guild_id, member_id, role_ids):
+        """Role IDs from `role_ids` the member lacks, or None if the guild isn't indexed."""
+        roles = self._guilds.get(guild_id)
+        if roles is None:
+            return None
+        return [role_id for role_id in role_ids if member_id not in roles.get(role_id, ())]
+
+    def member_count(self, guild_id, role_id):
+        return len(self._guilds.get(guild_id, {}).get(role_id, ()))
+
+    def __len__(self):
+        return sum(len(members) for roles in self._guilds.values() for members in roles.values())
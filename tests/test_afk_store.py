@@ -0,0 +1,35 @@
+import asyncio
+import sqlite3
+import threading
+
+from afk_store import AfkStore
+
+
+def test_cancelled_flush_is_written_before_close(tmp_path):
+    path = str(tmp_path / "afk.db")
+    store = AfkStore(path)
+    gate = threading.Event()
+    write = store._write
+
+    def slow_write(pending):
+        gate.wait(5)
+        write(pending)
+
+    store._write = slow_write
+
+    async def main():
+        store.set(1, 10, "lunch")
+        flush = asyncio.create_task(store.flush())
+        await asyncio.sleep(0.05)  # batch swapped out, write parked on its thread
+        store.set(1, 11, "later")
+        flush.cancel()
+        closing = asyncio.create_task(store.aclose())
+        await asyncio.sleep(0.05)
+        assert not closing.done()
+        gate.set()
+        await closing
+
+    asyncio.run(main())
+    conn = sqlite3.connect(path)
+    assert sorted(conn.execute("SELECT user_id FROM afk")) == [(10,), (11,)]
+    conn.close()
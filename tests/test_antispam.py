@@ -0,0 +1,40 @@
+from antispam import SpamDetector
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_violation_is_reported_once_per_cooldown():
+    clock = FakeClock()
+    detector = SpamDetector(max_messages=3, window=5.0, punish_cooldown=60.0, clock=clock)
+    key = (1, 2)
+    results = []
+    for _ in range(30):
+        clock.now += 0.1
+        results.append(detector.check(key, None))
+    assert sum(1 for r in results if r) == 1
+    assert detector.violations == 1
+
+    clock.now += 60
+    results = [detector.check(key, None) for _ in range(3)]
+    assert results[:2] == [None, None] and results[2]
+    assert detector.violations == 2
+
+
+def test_cooldown_is_per_user_and_evicted_when_lapsed():
+    clock = FakeClock()
+    detector = SpamDetector(max_duplicates=2, punish_cooldown=10.0, clock=clock)
+    assert detector.check((1, 1), "buy now") is None
+    assert detector.check((1, 1), "buy now")
+    assert detector.check((1, 1), "buy now") is None
+    assert detector.check((1, 2), "buy now") is None
+    assert detector.check((1, 2), "buy now")
+
+    clock.now += 11
+    detector.evict_idle()
+    assert not detector._punished
@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+
+from cases import CaseStore
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def stored_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM cases ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_failed_batch_is_retried_not_dropped(tmp_path):
+    path = str(tmp_path / "cases.db")
+    store = CaseStore(path, retry_delay=0.01, max_retry_delay=0.02)
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE cases RENAME TO cases_away")  # every insert now fails
+    conn.commit()
+
+    case_id = store.record(1, "Ban", 10, "target", 20, "reason")
+    time.sleep(0.1)
+    assert store.get(1, case_id) is not None  # still served from memory while failing
+
+    conn.execute("ALTER TABLE cases_away RENAME TO cases")
+    conn.commit()
+    conn.close()
+    assert wait_for(lambda: stored_ids(path) == [case_id])
+    store.close()
+
+
+def test_close_does_not_hang_when_writes_keep_failing(tmp_path):
+    path = str(tmp_path / "cases.db")
+    store = CaseStore(path, retry_delay=0.01, max_retry_delay=0.02, close_attempts=2)
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE cases")
+    conn.commit()
+    conn.close()
+
+    store.record(1, "Kick", 10, "target", 20)
+    closer = threading.Thread(target=store.close)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+
+
+def all_pages(store, guild_id, limit, **filters):
+    ids, before = [], None
+    while True:
+        rows, before = store.page(guild_id, before_id=before, limit=limit, **filters)
+        ids.extend(row["id"] for row in rows)
+        if before is None:
+            return ids
+
+
+def test_page_walks_persisted_and_pending_cases_without_gaps_or_repeats(tmp_path):
+    path = str(tmp_path / "cases.db")
+    store = CaseStore(path)
+    expected = {}
+    for i in range(7):
+        target = 10 + i % 2
+        expected[store.record(1, "Warn", target, "t", 20)] = target
+    store.record(2, "Warn", 10, "t", 20)  # other guild
+    assert wait_for(lambda: len(stored_ids(path)) == 8)
+
+    # Hold the writer just after its commit: those rows are now both on disk
+    # and still pending, and everything recorded later stays pending only.
+    release = threading.Event()
+    write_batch = store._write_batch
+
+    def held_write_batch(conn, batch):
+        result = write_batch(conn, batch)
+        release.wait(5)
+        return result
+
+    store._write_batch = held_write_batch
+    for i in range(7, 20):
+        target = 10 + i % 2
+        expected[store.record(1, "Warn", target, "t", 20)] = target
+    assert wait_for(lambda: len(stored_ids(path)) > 8)
+    assert store._pending
+
+    newest_first = sorted(expected, reverse=True)
+    for limit in (1, 3, 4, 25):
+        assert all_pages(store, 1, limit) == newest_first
+        assert all_pages(store, 1, limit, target_id=11) == [i for i in newest_first if expected[i] == 11]
+    assert store.count(1) == len(expected)
+
+    release.set()
+    store.close()
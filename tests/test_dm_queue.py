@@ -0,0 +1,53 @@
+import asyncio
+
+from dm_queue import DMQueue, PRIORITY_MODERATION, PRIORITY_RECEIPT
+
+
+def test_close_resolves_and_cancels_delayed_jobs(tmp_path):
+    path = str(tmp_path / "dm.db")
+    sent = []
+
+    async def main():
+        queue = DMQueue(path, is_transient=lambda e: True, per_user_interval=60.0, base_backoff=60.0)
+        queue.start()
+
+        async def send():
+            sent.append(1)
+
+        first = queue.submit("welcome", 1, send)
+        second = queue.submit("welcome", 1, send)  # parked behind the per-user gap
+        await asyncio.sleep(0.05)
+        assert first.result() is True
+        assert len(queue._delayed) == 1
+        handle = next(iter(queue._delayed.values()))
+
+        await queue.close(timeout=0.1)
+        assert second.done() and second.result() is False
+        assert handle.cancelled()
+        assert not queue._delayed
+
+    asyncio.run(main())
+    assert sent == [1]
+
+
+def test_moderation_dm_goes_ahead_of_queued_receipts(tmp_path):
+    path = str(tmp_path / "dm.db")
+    sent = []
+
+    async def main():
+        queue = DMQueue(path, is_transient=lambda e: False, workers=1, rate_per_second=1000.0, per_user_interval=0)
+
+        def send(label):
+            async def deliver():
+                sent.append(label)
+            return deliver
+
+        queue.start()
+        for uid in range(50):
+            queue.submit("receipt", uid, send("receipt"), priority=PRIORITY_RECEIPT)
+        done = queue.submit("moderation", 999, send("moderation"), priority=PRIORITY_MODERATION)
+        assert await asyncio.wait_for(done, timeout=5)
+        await queue.close(timeout=5)
+
+    asyncio.run(main())
+    assert sent.index("moderation") <= 1  # at most the receipt already being sent goes first
@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+
+from expiries import ExpiryStore, ExpiryWaiter
+
+
+def test_waiter_fires_due_rows_and_applies_retries(tmp_path):
+    store = ExpiryStore(str(tmp_path / "expiries.db"))
+    now = 1_000.0
+    store.add("unban", 1, 10, due=now - 5)
+    store.add("unrole", 1, 11, due=now - 1, role_id=7)
+    store.add("unban", 1, 12, due=now + 3600)
+    fired = []
+
+    async def callback(row):
+        fired.append(row["user_id"])
+        return now + 60 if row["kind"] == "unrole" else None
+
+    async def main():
+        waiter = ExpiryWaiter(store, callback, clock=lambda: now)
+        task = asyncio.create_task(waiter.run())
+        for _ in range(200):
+            if len(fired) == 2 and len(store.pending(1)) == 2 and store.next_due() == now + 60:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(main())
+    assert sorted(fired) == [10, 11]
+    assert [(row["user_id"], row["due"]) for row in store.pending(1)] == [(11, now + 60), (12, now + 3600)]
+    store.close()
+
+
+def test_waiter_survives_store_errors():
+    class FlakyStore:
+        def __init__(self):
+            self.calls = 0
+            self.removed = []
+
+        def due(self, now):
+            self.calls += 1
+            if self.calls <= 2:
+                raise sqlite3.OperationalError("database is locked")
+            return [{"id": 1, "kind": "unban"}] if not self.removed else []
+
+        def next_due(self):
+            return None
+
+        def remove(self, expiry_id):
+            self.removed.append(expiry_id)
+
+    store = FlakyStore()
+
+    async def callback(row):
+        return None
+
+    async def main():
+        waiter = ExpiryWaiter(store, callback, retry_delay=0.01)
+        task = asyncio.create_task(waiter.run())
+        for _ in range(200):
+            if store.removed:
+                break
+            await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(main())
+    assert store.removed == [1]
@@ -0,0 +1,155 @@
+import random
+from collections import Counter
+
+from giveaways import AliasTable, GiveawayJournal, ParticipantSet
+
+
+def snapshot(giveaways):
+    return {
+        gid: (
+            {k: v for k, v in g.items() if k not in ("participants", "drawn")},
+            g["participants"], len(g["participants"]), set(g["drawn"]),
+        )
+        for gid, g in giveaways.items()
+    }
+
+
+def test_compact_keeps_records_appended_after_the_snapshot(tmp_path):
+    path = str(tmp_path / "giveaways.journal")
+    journal = GiveawayJournal(path)
+    journal.replay()
+    journal.start({"id": 1, "prize": "a"})
+    journal.start({"id": 2, "prize": "b"})
+    for uid in range(100, 110):
+        journal.join(1, uid)
+    journal.join(2, 500, 3)
+    live, _ = journal.replay()
+
+    offset = journal.position()
+    live_snapshot = snapshot(live)
+    # Written while the compaction would be running on its worker thread
+    journal.join(1, 999)
+    live[1]["participants"].add(999)
+    journal.end(2)
+    journal.start({"id": 3, "prize": "c"})
+    journal.join(3, 7, 2)
+    journal.compact(live_snapshot, offset)
+    journal.close()
+
+    replayed, ended = GiveawayJournal(path).replay()
+    assert sorted(replayed) == [1, 3]
+    assert list(replayed[1]["participants"]) == list(range(100, 110)) + [999]
+    assert replayed[3]["participants"].weight_at(0) == 2
+    assert list(ended) == [2]
+
+
+def test_compact_after_close_leaves_the_journal_alone(tmp_path):
+    path = str(tmp_path / "giveaways.journal")
+    journal = GiveawayJournal(path)
+    journal.replay()
+    journal.start({"id": 1, "prize": "a"})
+    journal.join(1, 42)
+    offset = journal.position()
+    journal.close()
+    journal.compact({}, offset)
+
+    live, _ = GiveawayJournal(path).replay()
+    assert list(live[1]["participants"]) == [42]
+
+
+def test_ended_giveaways_and_draws_survive_replay_and_compaction(tmp_path):
+    path = str(tmp_path / "giveaways.journal")
+    journal = GiveawayJournal(path, keep_ended=2)
+    journal.replay()
+    for gid in (1, 2, 3):
+        journal.start({"id": gid, "prize": str(gid)})
+        journal.join(gid, 10 * gid)
+        journal.join(gid, 10 * gid + 1, 4)
+        journal.end(gid)
+    journal.drawn(3, [30])
+    journal.close()
+
+    journal = GiveawayJournal(path, keep_ended=2)
+    live, ended = journal.replay()
+    assert live == {}
+    assert list(ended) == [2, 3]
+    assert ended[3]["drawn"] == {30}
+    assert ended[3]["participants"].weight_at(1) == 4
+
+    journal.compact({}, journal.position(), ended=snapshot(ended))
+    journal.drawn(3, [31])
+    journal.close()
+    live, ended = GiveawayJournal(path, keep_ended=2).replay()
+    assert live == {}
+    assert list(ended) == [2, 3]
+    assert ended[3]["drawn"] == {30, 31}
+    assert list(ended[2]["participants"]) == [20, 21]
+
+
+def test_participant_set_keeps_order_and_rejects_duplicates_across_growth():
+    rng = random.Random(1)
+    ids = rng.sample(range(10**17, 10**18), 1000)
+    participants = ParticipantSet()
+    for uid in ids:
+        assert participants.add(uid)
+    for uid in ids[::7]:
+        assert not participants.add(uid)
+    assert len(participants) == 1000
+    assert list(participants) == ids
+    assert participants[500] == ids[500]
+    assert all(uid in participants for uid in ids)
+    assert not any(uid in participants for uid in rng.sample(range(1, 10**17), 200))
+    assert not participants.weighted
+
+
+def test_participant_set_weights_backfill_earlier_entrants():
+    participants = ParticipantSet([1, 2])
+    participants.add(3, 5)
+    participants.add(4)
+    assert participants.weighted
+    assert [participants.weight_at(i) for i in range(4)] == [1, 1, 5, 1]
+    assert not participants.add(3, 9)
+    assert participants.weight_at(2) == 5
+
+
+def test_participant_sample_respects_exclusions_on_every_path():
+    participants = ParticipantSet(range(1, 101))
+    rng = random.Random(2)
+    picked = participants.sample(10, rng)
+    assert len(set(picked)) == 10 and all(uid in participants for uid in picked)
+
+    few_excluded = set(range(1, 11))  # plenty left: rejection sampling
+    picked = participants.sample(20, rng, exclude=few_excluded)
+    assert len(set(picked)) == 20 and not few_excluded & set(picked)
+
+    most_excluded = set(range(1, 96))  # 5 left: linear pass
+    assert sorted(participants.sample(10, rng, exclude=most_excluded)) == [96, 97, 98, 99, 100]
+    assert participants.sample(3, rng, exclude=range(1, 101)) == []
+    assert participants.sample(3, rng, exclude={10**18}) != []  # non-members don't shrink the pool
+
+
+def test_alias_table_draws_in_proportion_to_weight():
+    participants = ParticipantSet()
+    for uid, weight in ((1, 1), (2, 2), (3, 7)):
+        participants.add(uid, weight)
+    table = AliasTable(participants)
+    rng = random.Random(3)
+    draws = Counter(table.draw(rng) for _ in range(100_000))
+    for uid, share in ((1, 0.1), (2, 0.2), (3, 0.7)):
+        assert abs(draws[uid] / 100_000 - share) < 0.01
+
+
+def test_alias_table_sample_skips_excluded_and_falls_back_when_weight_is_excluded():
+    participants = ParticipantSet()
+    participants.add(1, 100)
+    for uid in range(2, 6):
+        participants.add(uid)
+    table = AliasTable(participants)
+    rng = random.Random(4)
+
+    picked = table.sample(3, rng, exclude={1})
+    assert len(set(picked)) == 3 and 1 not in picked
+    # All but one low-weight entrant excluded: redraws give up, the linear pass finishes
+    assert table.sample(2, rng, exclude={1, 2, 3, 4}, max_attempts=1) == [5]
+    assert table.sample(1, rng, exclude={1, 2, 3, 4, 5}) == []
+    assert AliasTable(ParticipantSet()).sample(1, rng) == []
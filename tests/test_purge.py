@@ -0,0 +1,129 @@
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from purge import PurgeFilter, PurgeJob
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id, age_days, author_id=1, bot=False, content=""):
+        self.channel = channel
+        self.id = message_id
+        self.created_at = NOW - timedelta(days=age_days)
+        self.author = SimpleNamespace(id=author_id, bot=bot)
+        self.content = content
+        self.attachments = []
+
+    async def delete(self):
+        self.channel.messages.remove(self)
+        self.channel.single_deletes += 1
+
+
+class FakeChannel:
+    """Newest-first history honouring limit/before/after, like TextChannel.history."""
+
+    def __init__(self):
+        self.messages = []  # oldest first
+        self.bulk_sizes = []
+        self.single_deletes = 0
+
+    def post(self, age_days, **kwargs):
+        message = FakeMessage(self, len(self.messages) + 1, age_days, **kwargs)
+        self.messages.append(message)
+        return message
+
+    async def history(self, limit=None, after=None, before=None, oldest_first=False):
+        yielded = 0
+        for message in reversed(list(self.messages)):
+            if limit is not None and yielded >= limit:
+                return
+            if isinstance(before, FakeMessage) and message.id >= before.id:
+                continue
+            if isinstance(before, datetime) and message.created_at >= before:
+                continue
+            if after is not None and message.created_at <= after:
+                continue
+            yielded += 1
+            yield message
+
+    async def delete_messages(self, messages):
+        self.bulk_sizes.append(len(messages))
+        for message in messages:
+            self.messages.remove(message)
+
+
+def run(job):
+    return asyncio.run(job.run())
+
+
+def test_plain_purge_deletes_exactly_n_with_status_message_newest():
+    channel = FakeChannel()
+    for _ in range(20):
+        channel.post(age_days=0.001)
+    status = channel.post(age_days=0)  # the progress message, posted before the scan starts
+    job = PurgeJob([channel], PurgeFilter(), limit=5, scan_limit=5, clock=lambda: NOW)
+    job.protected.add(status.id)
+    job.start_before = status
+    run(job)
+    assert job.deleted == 5
+    assert status in channel.messages
+    assert len(channel.messages) == 16
+
+
+def test_young_messages_bulk_deleted_old_ones_singly():
+    channel = FakeChannel()
+    for i in range(150):
+        channel.post(age_days=20 - i * 0.1)  # first ~60 are older than 14 days
+    job = PurgeJob([channel], PurgeFilter(), clock=lambda: NOW, concurrency=3)
+    run(job)
+    assert channel.messages == []
+    assert job.deleted == 150
+    assert max(channel.bulk_sizes) <= 100
+    assert channel.single_deletes == 150 - sum(channel.bulk_sizes)
+    assert channel.single_deletes > 0
+
+
+def test_filters_and_limit_across_channels():
+    first, second = FakeChannel(), FakeChannel()
+    for channel in (first, second):
+        for i in range(30):
+            channel.post(age_days=0.01, author_id=i % 3, content="buy now" if i % 2 else "hello")
+    purge_filter = PurgeFilter(authors=[1], pattern=re.compile("buy"))
+    job = PurgeJob([first, second], purge_filter, clock=lambda: NOW)
+    run(job)
+    for channel in (first, second):
+        assert not [m for m in channel.messages if m.author.id == 1 and "buy" in m.content]
+        assert len(channel.messages) == 25
+
+    channel = FakeChannel()
+    for _ in range(30):
+        channel.post(age_days=0.01)
+    job = PurgeJob([channel], PurgeFilter(), limit=7, clock=lambda: NOW)
+    run(job)
+    assert job.deleted == 7
+
+
+def test_cancel_stops_scanning():
+    channel = FakeChannel()
+    for _ in range(50):
+        channel.post(age_days=0.01)
+    job = PurgeJob([channel], PurgeFilter(), clock=lambda: NOW)
+    job.cancel()
+    run(job)
+    assert job.deleted == 0
+    assert len(channel.messages) == 50
+
+
+def test_limit_across_channels_is_taken_in_listed_order():
+    first, second = FakeChannel(), FakeChannel()
+    for channel in (first, second):
+        for _ in range(10):
+            channel.post(age_days=0.01)
+    job = PurgeJob([first, second], PurgeFilter(), limit=14, scan_limit=14, clock=lambda: NOW)
+    run(job)
+    assert job.deleted == 14
+    assert len(first.messages) == 0
+    assert len(second.messages) == 6
@@ -0,0 +1,85 @@
+import asyncio
+import random
+
+from timers import TimerEngine, TimingWheel
+
+
+class SmallWheel(TimingWheel):
+    # 4 slots x 3 levels = 64s before the overflow bucket, so every boundary is cheap to cross
+    BITS = 2
+    SLOTS = 1 << BITS
+    LEVELS = 3
+
+
+def run_until(wheel, end, step):
+    fired = {}
+    while wheel.now < end:
+        to = min(end, wheel.now + step)
+        for key, due in wheel.advance(to):
+            assert key not in fired
+            assert due <= to
+            fired[key] = to
+    return fired
+
+
+def test_entries_cascade_across_level_boundaries_and_fire_on_time():
+    for wheel_cls, horizon in ((SmallWheel, 300), (TimingWheel, 5000)):
+        rng = random.Random(horizon)
+        start = 1_000_000 - 3  # just below a boundary at every level
+        wheel = wheel_cls(start)
+        dues = {key: start + rng.randint(1, horizon) for key in range(500)}
+        for key, due in dues.items():
+            wheel.insert(key, due)
+        fired = run_until(wheel, start + horizon, step=1)
+        assert fired == dues
+        assert len(wheel) == 0
+
+
+def test_coarse_advances_fire_everything_passed():
+    wheel = SmallWheel(10)
+    dues = {key: 10 + key * 7 for key in range(1, 40)}
+    for key, due in dues.items():
+        wheel.insert(key, due)
+    fired = run_until(wheel, 10 + 40 * 7, step=50)
+    assert set(fired) == set(dues)
+    assert all(dues[key] <= at < dues[key] + 50 for key, at in fired.items())
+
+
+def test_cancel_reinsert_and_overdue():
+    wheel = SmallWheel(100)
+    wheel.insert("a", 110)
+    wheel.insert("b", 200)
+    wheel.insert("c", 90)  # already overdue: returned by the next advance
+    wheel.cancel("b")
+    wheel.insert("a", 130)  # reinsert moves it
+    assert len(wheel) == 2 and "b" not in wheel
+
+    assert wheel.advance(100) == [("c", 90)]
+    assert wheel.advance(129) == []
+    assert wheel.advance(130) == [("a", 130)]
+    assert len(wheel) == 0
+    wheel.cancel("a")  # cancelling a fired key is a no-op
+
+
+def test_engine_close_waits_for_a_running_tick():
+    events = []
+
+    async def callback(key):
+        events.append(("start", key))
+        await asyncio.sleep(0.05)
+        events.append(("end", key))
+        return None
+
+    async def main():
+        engine = TimerEngine(callback)
+        engine.start()
+        engine.schedule("t", 0)
+        while not events:
+            await asyncio.sleep(0.005)
+        await engine.close()
+        events.append(("closed", None))
+        engine.schedule("u", 0)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert events == [("start", "t"), ("end", "t"), ("closed", None)]
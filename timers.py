@@ -0,0 +1,202 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+
+# -------------------- Timing wheel --------------------
+class TimingWheel:
+    """Hierarchical timing wheel with 1-second ticks.
+
+    LEVELS wheels of SLOTS slots each; level l covers SLOTS**(l+1) seconds, so
+    5 levels of 64 reach ~34 years. An entry sits at the lowest level whose
+    higher digits (base SLOTS) of `due` match the current time, and cascades
+    down one level each time that digit rolls over. Insert and cancel are O(1);
+    each tick touches one level-0 slot plus an occasional cascade.
+    """
+
+    BITS = 6
+    SLOTS = 1 << BITS
+    LEVELS = 5
+
+    def __init__(self, now):
+        self.now = int(now)
+        self._wheels = [[{} for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self._overflow = {}  # beyond the top level
+        self._where = {}  # key -> bucket dict holding it
+        self._ready = {}  # due at or before `now`, returned by the next advance()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def reset(self, now):
+        """Jump the clock forward; only allowed while the wheel is empty."""
+        if self._where:
+            raise RuntimeError("cannot reset a non-empty timing wheel")
+        self.now = max(self.now, int(now))
+
+    def _bucket(self, due):
+        if due <= self.now:
+            return self._ready
+        for level in range(self.LEVELS):
+            shift = self.BITS * (level + 1)
+            if (due >> shift) == (self.now >> shift):
+                return self._wheels[level][(due >> (self.BITS * level)) & (self.SLOTS - 1)]
+        return self._overflow
+
+    def insert(self, key, due):
+        self.cancel(key)
+        due = int(due)
+        bucket = self._bucket(due)
+        bucket[key] = due
+        self._where[key] = bucket
+
+    def cancel(self, key):
+        bucket = self._where.pop(key, None)
+        if bucket is not None:
+            del bucket[key]
+
+    def _cascade(self, bucket):
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, due in entries:
+            target = self._bucket(due)
+            target[key] = due
+            self._where[key] = target
+
+    def advance(self, to):
+        """Move the clock to `to`, returning [(key, due)] for every entry that came due."""
+        expired = list(self._ready.items())
+        self._ready.clear()
+        mask = self.SLOTS - 1
+        while self.now < int(to):
+            self.now += 1
+            t = self.now
+            # Cascade from the highest level whose digit rolled over, downwards.
+            if t & ((1 << (self.BITS * self.LEVELS)) - 1) == 0:
+                self._cascade(self._overflow)
+            for level in range(self.LEVELS - 1, 0, -1):
+                if t & ((1 << (self.BITS * level)) - 1) == 0:
+                    self._cascade(self._wheels[level][(t >> (self.BITS * level)) & mask])
+            bucket = self._wheels[0][t & mask]
+            if bucket:
+                expired.extend(bucket.items())
+                bucket.clear()
+            if self._ready:
+                expired.extend(self._ready.items())
+                self._ready.clear()
+        for key, _ in expired:
+            del self._where[key]
+        return expired
+
+
+class TimerEngine:
+    """Drives a TimingWheel from one coroutine; same callback contract as DueScheduler.
+
+    The callback gets the key and returns its next due time (wall clock) or None.
+    """
+
+    def __init__(self, callback, clock=time.time):
+        self.callback = callback
+        self.clock = clock
+        self.wheel = TimingWheel(clock())
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self, timeout=5.0):
+        """Stop ticking. A tick in progress gets `timeout` seconds to finish, then is cancelled."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+
+    def schedule(self, key, due):
+        if not self.wheel:
+            self.wheel.reset(self.clock())
+        self.wheel.insert(key, due)
+        self._wakeup.set()
+
+    def cancel(self, key):
+        self.wheel.cancel(key)
+
+    def __len__(self):
+        return len(self.wheel)
+
+    async def _fire(self, key):
+        try:
+            next_due = await self.callback(key)
+        except Exception as e:
+            print(f"Timer callback failed for {key}: {e}")
+            return
+        if next_due is not None:
+            self.schedule(key, next_due)
+
+    async def run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            if not self.wheel:
+                await self._wakeup.wait()
+                continue
+            expired = self.wheel.advance(self.clock())
+            if expired:
+                await asyncio.gather(*(self._fire(key) for key, _ in expired))
+            # Sleep to the next whole-second tick
+            await asyncio.sleep(1 - (self.clock() % 1))
+
+
+# -------------------- Persistence --------------------
+class TimerStore:
+    """SQLite table of running timers; small writes, one per create/finish/cancel."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS timers ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "guild_id INTEGER, "
+            "channel_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "end_at REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS timers_user ON timers (user_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS timers_guild ON timers (guild_id)")
+        self._conn.commit()
+
+    def load(self):
+        rows = self._conn.execute(
+            "SELECT id, guild_id, channel_id, message_id, user_id, end_at, created_at FROM timers"
+        )
+        keys = ("id", "guild_id", "channel_id", "message_id", "user_id", "end_at", "created_at")
+        return {row[0]: dict(zip(keys, row)) for row in rows}
+
+    def add(self, guild_id, channel_id, message_id, user_id, end_at):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO timers (guild_id, channel_id, message_id, user_id, end_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (guild_id, channel_id, message_id, user_id, end_at, time.time()),
+            )
+        return cursor.lastrowid
+
+    def remove(self, timer_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM timers WHERE id = ?", (timer_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()